@@ -1,7 +1,7 @@
 import traceback
 import logging.config
 from flask import Flask
-from flask import render_template, request, redirect, url_for
+from flask import render_template, request, redirect, url_for, jsonify
 import config.config as config
 
 # Initialize the Flask application
@@ -15,9 +15,16 @@ logging.config.fileConfig(app.config["LOGGING_CONFIG"])
 logger = logging.getLogger(app.config["APP_NAME"])
 logger.debug('Web app log')
 
-from src.add_topics_db import Topics, TopicManager
+from src.add_topics_db import Topics, TopicSummary, TopicManager, pool_stats
 topics_manager = TopicManager(app)
 
+from src.model_registry import ModelRegistry, ModelNotFoundError
+model_registry = ModelRegistry(app.config["MODEL_DIR"], max_models=app.config["MODEL_CACHE_SIZE"])
+
+from src.score_topics import MicroBatcher, TopicScorer
+score_batcher = MicroBatcher(TopicScorer(model_registry, tokenizer=app.config["SCORE_TOKENIZER"]),
+                             max_batch_size=app.config["SCORE_MAX_BATCH_SIZE"], max_wait=app.config["SCORE_MAX_WAIT"])
+
 @app.route("/", methods=['GET', 'POST'])
 def index():
     selectDate = ['Select Date', 'January', 'March']
@@ -35,6 +42,70 @@ def january():
 def march():
     return render_template("march.html")
 
+@app.route("/models")
+def models():
+    return jsonify(dates=model_registry.dates(), stats=model_registry.stats())
+
+@app.route("/pool")
+def pool():
+    return jsonify(pool_stats())
+
+@app.route("/windows")
+def windows():
+    return jsonify(dates=topics_manager.windows())
+
+@app.route("/topics/<date>")
+def topics(date):
+    # ?topic=3 restricts to one topic, ?after=<next of the previous page> gives the next page
+    topic_num = request.args.get('topic', type=int)
+    limit = min(request.args.get('limit', app.config["MAX_ROWS_SHOW"], type=int), app.config["MAX_ROWS_SHOW"])
+    after = request.args.get('after')
+
+    if limit < 1:
+        return jsonify(error="limit must be at least 1."), 400
+
+    try:
+        if after is not None:
+            last_topic, last_prob, last_id = after.split(':')
+            after = (int(last_topic), float(last_prob), int(last_id))
+    except ValueError:
+        return jsonify(error="after must be topic_num:prob:read_tweet_id."), 400
+
+    rows, next_key = topics_manager.top_tweets(date, topic_num=topic_num, after=after, limit=limit)
+    columns = [column.name for column in Topics.__table__.columns]
+
+    return jsonify(date=date, rows=[{column: getattr(row, column) for column in columns} for row in rows],
+                   next=':'.join(map(repr, next_key)) if next_key else None)
+
+@app.route("/summary/<date>")
+def summary(date):
+    columns = [column.name for column in TopicSummary.__table__.columns]
+
+    return jsonify(date=date, topics=[{column: getattr(row, column) for column in columns}
+                                      for row in topics_manager.topic_summary(date)])
+
+@app.route("/score", methods=['POST'])
+def score():
+    # {"date": "2020-01-15", "texts": ["...", ...]} or {"date": "2020-01-15", "text": "..."}
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        body = {}
+    date = body.get('date')
+    texts = body.get('texts', [body['text']] if 'text' in body else [])
+
+    if not isinstance(date, str) or not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+        return jsonify(error="Expected a date and one or more texts."), 400
+
+    try:
+        result = score_batcher.submit((date, texts), size=len(texts)).result(timeout=app.config["SCORE_TIMEOUT"])
+    except ModelNotFoundError:
+        return jsonify(error="No model for %s." % date, dates=model_registry.dates()), 404
+    except Exception:
+        logger.error(traceback.format_exc())
+        return jsonify(error="Scoring failed."), 500
+
+    return jsonify(result)
+
 @app.route('/submit', methods=['POST'])
 def submit():
     if request.method == 'POST':
@@ -30,7 +30,7 @@ def index():
 @app.route("/january")
 def january():
     try:
-        topics = topics_manager.session.query(topics).limit(app.config["MAX_ROWS_SHOW"]).all()
+        topics, _ = topics_manager.top_tweets('2020-01-15', limit=app.config["MAX_ROWS_SHOW"])
         logger.debug("January page accessed")
         return render_template('january.html', topics=topics)
     except:
@@ -0,0 +1,61 @@
+"""Compare the memory of cleaned documents kept as lists of str with CompactDocs.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_compact_docs --data_path data/sample/tweets.csv --repeat 10000
+
+Documents are tokenized with the 'regex' tokenizer, so every copy of a tweet holds its own token strings
+as the output of clean_texts does. Memory is measured with tracemalloc after the construction temporaries
+are released.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import pandas as pd
+
+from src.process_data import tokenize_texts, create_dictionary, CompactDocs
+
+
+def retained_bytes(build):
+    """Bytes still allocated by the object returned by build, and the object."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, obj
+
+
+def timed(func, *args):
+    """Seconds taken by func(*args)."""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--repeat', type=int, default=10000,
+                        help="Number of copies of the tweets")
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].str.lower().tolist() * args.repeat
+
+    list_bytes, doc_clean = retained_bytes(lambda: tokenize_texts(tweets, 'regex'))
+    compact_bytes, docs = retained_bytes(lambda: CompactDocs.from_texts(doc_clean))
+    n_tokens = len(docs.token_ids)
+
+    print("%s documents, %s tokens, %s distinct words" % (len(docs), n_tokens, len(docs.vocab)))
+    print("%-14s %12s %16s" % ('store', 'MB', 'bytes per token'))
+    print("%-14s %12.1f %16.1f" % ('lists of str', list_bytes / 1e6, list_bytes / n_tokens))
+    print("%-14s %12.1f %16.1f" % ('CompactDocs', compact_bytes / 1e6, compact_bytes / n_tokens))
+
+    print("\ncreate_dictionary seconds")
+    print("%-14s %12.2f" % ('lists of str', timed(create_dictionary, doc_clean)))
+    print("%-14s %12.2f" % ('CompactDocs', timed(create_dictionary, docs)))
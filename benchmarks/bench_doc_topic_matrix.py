@@ -0,0 +1,101 @@
+"""Benchmark get_doc_topic_matrix on synthetic topic probabilities.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_doc_topic_matrix --sizes 10000 100000 1000000
+
+The legacy per-document loop is timed on small windows only, since its cost grows quadratically.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.train_lda import get_doc_topic_matrix
+
+
+class SyntheticLda:
+    """Stand-in for a trained LdaModel that streams precomputed topic probabilities."""
+
+    def __init__(self, doc_topic_probs, minimum_probability=0.01):
+        self.doc_topic_probs = doc_topic_probs
+        self.num_topics = doc_topic_probs.shape[1]
+        self.minimum_probability = minimum_probability
+
+    def get_document_topics(self, bow, **kwargs):
+        for row in self.doc_topic_probs:
+            yield [(topic, prob) for topic, prob in enumerate(row.tolist()) if prob >= self.minimum_probability]
+
+
+def make_window(n_docs, num_topics, seed):
+    """Create synthetic topic probabilities and a tweet dataframe with n_docs rows."""
+    rng = np.random.default_rng(seed)
+    doc_topic_probs = rng.dirichlet(np.full(num_topics, 0.3), size=n_docs).astype(np.float32)
+    flags = rng.integers(0, 2, size=(n_docs, 4), dtype=np.int8)
+    tweet_df = pd.DataFrame({'read_text_clean2': 'synthetic tweet text',
+                             'Perceived_susceptibility': flags[:, 0],
+                             'Perceived_severity': flags[:, 1],
+                             'Perceived_benefits': flags[:, 2],
+                             'Perceived_barriers': flags[:, 3]})
+    return doc_topic_probs, tweet_df
+
+
+def legacy_doc_topic_df(doc_topics, tweet_df):
+    """Per-document loop used by get_doc_topic_matrix before it was vectorized."""
+    doc_topic_max = []
+    for d in range(len(doc_topics)):
+        topic_df = pd.DataFrame(doc_topics[d])
+        topic_df.columns = ['topic_num', 'prob']
+        topic_df = topic_df.iloc[topic_df['prob'].argmax()]
+        topic_df = pd.DataFrame(topic_df).transpose()
+        tweet_data_subset_df = tweet_df.reset_index()
+        timeframe_slice = tweet_data_subset_df[['read_text_clean2', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']]
+        topic_df = pd.concat([topic_df, timeframe_slice.reindex(topic_df.index)], axis=1, join="inner")
+        doc_topic_max.append(topic_df)
+    return pd.concat(doc_topic_max)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                        help="Window sizes (number of tweets) to benchmark")
+    parser.add_argument('--legacy_sizes', nargs='+', type=int, default=[1000, 2000, 4000],
+                        help="Window sizes to benchmark with the legacy per-document loop")
+    parser.add_argument('--num_topics', type=int, default=10,
+                        help="Number of topics in the synthetic model")
+    parser.add_argument('--seed', type=int, default=66826,
+                        help="Random seed for the synthetic data")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'data/results'))
+    os.chdir(workdir)
+
+    print("%-10s %10s %12s %16s" % ('impl', 'tweets', 'seconds', 'us per tweet'))
+
+    for n_docs in args.legacy_sizes:
+        doc_topic_probs, tweet_df = make_window(n_docs, args.num_topics, args.seed)
+        doc_topics = list(SyntheticLda(doc_topic_probs).get_document_topics(None))
+        start = time.perf_counter()
+        legacy_doc_topic_df(doc_topics, tweet_df)
+        elapsed = time.perf_counter() - start
+        print("%-10s %10d %12.3f %16.2f" % ('legacy', n_docs, elapsed, 1e6 * elapsed / n_docs))
+
+    for n_docs in args.sizes:
+        doc_topic_probs, tweet_df = make_window(n_docs, args.num_topics, args.seed)
+        lda_model = SyntheticLda(doc_topic_probs)
+
+        # time spent producing the (topic_num, prob) lists is charged to gensim, not to get_doc_topic_matrix
+        start = time.perf_counter()
+        for _ in lda_model.get_document_topics(None):
+            pass
+        produce = time.perf_counter() - start
+
+        start = time.perf_counter()
+        get_doc_topic_matrix(lda_model, None, tweet_df, 'benchmark')
+        elapsed = time.perf_counter() - start - produce
+        print("%-10s %10d %12.3f %16.2f" % ('batched', n_docs, elapsed, 1e6 * elapsed / n_docs))
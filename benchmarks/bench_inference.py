@@ -0,0 +1,68 @@
+"""Compare topic inference of new tweets with gensim's get_document_topics and with TopicInferencer.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_inference --data_path data/sample/tweets.csv --repeat 200 --num_topics 8
+
+A model is trained on the cleaned tweets and saved to a temporary folder, then both engines score the
+same documents. gensim starts each document from a random gamma, so the difference is bounded by the
+convergence tolerance rather than zero.
+"""
+import argparse
+import os
+import string
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import clean_texts, get_stop_words, create_dictionary
+from src.train_lda import fit_lda
+from src.infer_topics import TopicInferencer, export_inference_arrays
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--repeat', type=int, default=200,
+                        help="Number of copies of the tweets to score")
+    parser.add_argument('--num_topics', type=int, default=8)
+    parser.add_argument('--passes', type=int, default=5)
+    parser.add_argument('--batch_size', type=int, default=5000)
+    parser.add_argument('--random_state', type=int, default=66826)
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].tolist() * args.repeat
+    doc_clean = clean_texts(tweets, get_stop_words(), set(string.punctuation), WordNetLemmatizer(), tokenizer='regex')
+    dictionary, doc_term_matrix = create_dictionary(doc_clean)
+    lda_model = fit_lda(doc_term_matrix, dictionary, args.num_topics, args.random_state, passes=args.passes)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        model_path = os.path.join(model_dir, 'lda_cov_model')
+        lda_model.save(model_path)
+        export_inference_arrays(lda_model, model_path)
+
+        start = time.perf_counter()
+        inferencer = TopicInferencer.load(model_path, mmap_mode='r', batch_size=args.batch_size)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = np.array([[prob for _, prob in lda_model.get_document_topics(bow, minimum_probability=0)]
+                             for bow in doc_term_matrix])
+        gensim_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        probs = inferencer.topic_matrix(doc_clean)
+        numpy_seconds = time.perf_counter() - start
+
+    print("%s documents, %s terms, %s topics" % (len(doc_clean), len(dictionary), args.num_topics))
+    print("%-18s %10s %14s" % ('engine', 'seconds', 'docs per sec'))
+    print("%-18s %10.2f %14.0f" % ('gensim', gensim_seconds, len(doc_clean) / gensim_seconds))
+    print("%-18s %10.2f %14.0f" % ('TopicInferencer', numpy_seconds, len(doc_clean) / numpy_seconds))
+    print("\nTopicInferencer load seconds %.3f" % load_seconds)
+    print("max abs difference %.2e, same top topic %.1f%%" % (np.abs(probs - expected).max(),
+                                                             100 * (probs.argmax(axis=1) == expected.argmax(axis=1)).mean()))
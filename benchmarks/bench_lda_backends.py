@@ -0,0 +1,54 @@
+"""Compare the lda training backends of fit_lda: wall time and coherence.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_lda_backends --data_path data/sample/tweets.csv --repeat 200 --num_topics 8 --workers 1 3
+
+Each configuration trains one model on the cleaned tweets and is scored with the same CoherenceEngine,
+so coherence differences come from the backend alone.
+"""
+import argparse
+import string
+import time
+
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import clean_texts, get_stop_words, create_dictionary
+from src.train_lda import fit_lda
+from src.coherence import CoherenceEngine
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--repeat', type=int, default=200,
+                        help="Number of copies of the tweets in the training corpus")
+    parser.add_argument('--num_topics', type=int, default=8)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 3],
+                        help="LdaMulticore worker counts to compare with LdaModel")
+    parser.add_argument('--chunksize', type=int, default=2000)
+    parser.add_argument('--passes', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--coherence', default='c_v')
+    parser.add_argument('--random_state', type=int, default=66826)
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].tolist() * args.repeat
+    doc_clean = clean_texts(tweets, get_stop_words(), set(string.punctuation), WordNetLemmatizer(), tokenizer='regex')
+    dictionary, doc_term_matrix = create_dictionary(doc_clean)
+    engine = CoherenceEngine(doc_clean, dictionary)
+
+    backends = [{'method': 'LdaModel'}] + [{'method': 'LdaMulticore', 'workers': workers} for workers in args.workers]
+
+    print("%s documents, %s terms, %s topics" % (len(doc_term_matrix), len(dictionary), args.num_topics))
+    print("%-24s %10s %10s" % ('backend', 'seconds', args.coherence))
+    for backend in backends:
+        start = time.perf_counter()
+        lda_model = fit_lda(doc_term_matrix, dictionary, args.num_topics, args.random_state, chunksize=args.chunksize,
+                            passes=args.passes, iterations=args.iterations, **backend)
+        seconds = time.perf_counter() - start
+        name = backend['method'] + (' workers=%s' % backend['workers'] if 'workers' in backend else '')
+        print("%-24s %10.2f %10.4f" % (name, seconds, engine.score_model(lda_model, args.coherence)))
@@ -0,0 +1,102 @@
+"""Load test POST /score: throughput and latency against the micro-batch size.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_score_endpoint --clients 32 --seconds 10 --batch_sizes 1 8 32 128
+
+A model is trained on the sample tweets and saved to a temporary MODEL_DIR, then app.py is served by a
+threaded werkzeug server. Every client thread posts one tweet at a time, as fast as it gets answers, for
+each max batch size in turn. A max batch size of 1 scores every request on its own.
+"""
+import os
+import json
+import time
+import string
+import argparse
+import tempfile
+import threading
+import urllib.request
+import importlib.util
+
+import numpy as np
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+from werkzeug.serving import make_server
+
+from src.process_data import clean_texts, get_stop_words, create_dictionary
+from src.train_lda import fit_lda
+from src.infer_topics import export_inference_arrays
+
+DATE = '2020-01-15'
+
+
+def load_app(model_dir):
+    """Import app.py, which the app/ folder shadows as a module name, serving the models of model_dir."""
+    os.environ['MODEL_DIR'] = model_dir
+    spec = importlib.util.spec_from_file_location('webapp', 'app.py')
+    webapp = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(webapp)
+    return webapp
+
+
+def client(url, tweets, stop, latencies):
+    """Post tweets one at a time until stop is set, recording the latency of each request."""
+    i = 0
+    while not stop.is_set():
+        body = json.dumps({'date': DATE, 'text': tweets[i % len(tweets)]}).encode('utf-8')
+        request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent client threads")
+    parser.add_argument('--seconds', type=float, default=10, help="Duration of each run")
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--max_wait', type=float, default=0.005)
+    parser.add_argument('--num_topics', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].tolist()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        doc_clean = clean_texts(tweets * 20, get_stop_words(), set(string.punctuation), WordNetLemmatizer())
+        dictionary, doc_term_matrix = create_dictionary(doc_clean)
+        lda_model = fit_lda(doc_term_matrix, dictionary, args.num_topics, 66826, passes=5)
+        lda_model.save(os.path.join(model_dir, 'lda_cov_model_' + DATE))
+        export_inference_arrays(lda_model, os.path.join(model_dir, 'lda_cov_model_' + DATE))
+
+        webapp = load_app(model_dir)
+        server = make_server('127.0.0.1', args.port, webapp.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:%s/score' % args.port
+
+        print("%s clients, max wait %.1f ms" % (args.clients, args.max_wait * 1000))
+        print("%12s %14s %10s %10s %12s" % ('batch size', 'requests/s', 'p50 ms', 'p99 ms', 'mean batch'))
+        for batch_size in args.batch_sizes:
+            batcher = webapp.score_batcher
+            batcher.max_batch_size, batcher.max_wait = batch_size, args.max_wait
+            batcher.stats.update(requests=0, items=0, batches=0)
+
+            stop, latencies = threading.Event(), []
+            threads = [threading.Thread(target=client, args=(url, tweets, stop, latencies)) for _ in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            latencies = np.array(latencies) * 1000
+            print("%12s %14.0f %10.1f %10.1f %12.1f" % (batch_size, len(latencies) / args.seconds, np.percentile(latencies, 50),
+                                                        np.percentile(latencies, 99), batcher.stats['items'] / max(batcher.stats['batches'], 1)))
+
+        server.shutdown()
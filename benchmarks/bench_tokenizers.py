@@ -0,0 +1,74 @@
+"""Compare the 'punkt' and 'regex' tokenizers of clean_texts: agreement and throughput.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_tokenizers --data_path data/sample/tweets.csv --repeat 100
+
+Agreement is reported on the raw tokens and on the cleaned documents that reach the dictionary.
+"""
+import argparse
+import string
+import time
+from collections import Counter
+
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import tokenize_texts, clean_texts, get_stop_words
+
+
+def agreement(docs_a, docs_b):
+    """Share of documents with identical tokens, and token-level F1 of docs_b against docs_a."""
+    exact = sum(a == b for a, b in zip(docs_a, docs_b)) / len(docs_a)
+    overlap = sum(sum((Counter(a) & Counter(b)).values()) for a, b in zip(docs_a, docs_b))
+    n_a = sum(len(a) for a in docs_a)
+    n_b = sum(len(b) for b in docs_b)
+    f1 = 2 * overlap / (n_a + n_b) if n_a + n_b else 1.0
+    return exact, f1
+
+
+def throughput(func, tweets):
+    """Tweets per second processed by func(tweets)."""
+    start = time.perf_counter()
+    func(tweets)
+    return len(tweets) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--repeat', type=int, default=100,
+                        help="Number of copies of the tweets used for the throughput benchmark")
+    parser.add_argument('--show', type=int, default=10,
+                        help="Number of disagreeing tweets to print")
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].tolist()
+    exclude = set(string.punctuation)
+    lemma = WordNetLemmatizer()
+    stop_words_list = get_stop_words()
+
+    tokens = {name: tokenize_texts(tweets, name) for name in ('punkt', 'regex')}
+    docs = {name: clean_texts(tweets, stop_words_list, exclude, lemma, tokenizer=name) for name in ('punkt', 'regex')}
+
+    print("Agreement of 'regex' with 'punkt' on %s tweets" % len(tweets))
+    print("%-10s %14s %12s" % ('stage', 'exact tweets', 'token F1'))
+    for stage, result in (('tokens', tokens), ('cleaned', docs)):
+        exact, f1 = agreement(result['punkt'], result['regex'])
+        print("%-10s %13.1f%% %12.4f" % (stage, 100 * exact, f1))
+
+    shown = 0
+    for tweet, punkt_doc, regex_doc in zip(tweets, docs['punkt'], docs['regex']):
+        if punkt_doc != regex_doc and shown < args.show:
+            print("\n%s\n  punkt: %s\n  regex: %s" % (tweet, punkt_doc, regex_doc))
+            shown += 1
+
+    corpus = tweets * args.repeat
+    print("\nThroughput on %s tweets (tweets per second)" % len(corpus))
+    print("%-10s %14s %14s" % ('tokenizer', 'tokenize', 'clean_texts'))
+    for name in ('punkt', 'regex'):
+        tokenize_rate = throughput(lambda x: tokenize_texts(x, name), corpus)
+        clean_rate = throughput(lambda x: clean_texts(x, stop_words_list, exclude, lemma, tokenizer=name), corpus)
+        print("%-10s %14.0f %14.0f" % (name, tokenize_rate, clean_rate))
@@ -0,0 +1,88 @@
+"""Time the TopicManager queries as the topics table grows.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_topic_queries --rows 100000 1000000 --rows_per_window 5000
+
+For each table size, time periods of rows_per_window top tweets are written with write_topics to a new
+sqlite database. The first and the last page of the middle time period are then read with keyset pagination,
+and the last page also with LIMIT/OFFSET for comparison, along with the list of time periods.
+"""
+import os
+import time
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.add_topics_db import Topics, create_db, write_topics, TopicManager
+
+
+def window_rows(input_date, rows, rng):
+    """Top tweets of a time period, shaped like the output of create_topics_table."""
+    return pd.DataFrame({'read_tweet_id': rng.choice(2 ** 62, size=rows, replace=False).astype(np.int64),
+                         'date': input_date,
+                         'topic_num': rng.integers(0, 20, size=rows),
+                         'prob': rng.random(rows),
+                         'tweet': 'tweet about covid cases and lockdown',
+                         'Perceived_susceptibility': rng.integers(0, 2, size=rows),
+                         'Perceived_severity': rng.integers(0, 2, size=rows),
+                         'Perceived_benefits': rng.integers(0, 2, size=rows),
+                         'Perceived_barriers': rng.integers(0, 2, size=rows)})
+
+
+def timed_ms(func, repeat):
+    """Best of repeat calls of func, in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--rows_per_window', type=int, default=5000)
+    parser.add_argument('--page', type=int, default=100, help="Rows per page")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--random_state', type=int, default=66826)
+    args = parser.parse_args()
+
+    print("%10s %9s %12s %12s %12s %12s" % ('rows', 'windows', 'first page', 'last page', 'offset page', 'windows()'))
+    for rows in args.rows:
+        rng = np.random.default_rng(args.random_state)
+        n_windows = rows // args.rows_per_window
+        dates = [(date(2020, 1, 1) + timedelta(days=i)).isoformat() for i in range(n_windows)]
+
+        with tempfile.TemporaryDirectory() as db_dir:
+            engine_string = 'sqlite:///' + os.path.join(db_dir, 'topics.db')
+            engine = create_db(engine_string)
+            for input_date in dates:
+                write_topics(engine, window_rows(input_date, args.rows_per_window, rng), input_date)
+
+            manager = TopicManager(engine_string=engine_string)
+            middle = dates[len(dates) // 2]
+
+            # key of the last page of the middle time period, found by walking its pages once
+            after, last_key, skipped = None, None, 0
+            while True:
+                page, after = manager.top_tweets(middle, after=after, limit=args.page)
+                if after is None:
+                    break
+                last_key, skipped = after, skipped + len(page)
+
+            offset_query = manager.session.query(Topics).filter(Topics.date == middle).order_by(
+                Topics.topic_num, Topics.prob.desc(), Topics.read_tweet_id.desc()).offset(skipped).limit(args.page)
+
+            print("%10s %9s %12.2f %12.2f %12.2f %12.2f" % (
+                rows, n_windows,
+                timed_ms(lambda: manager.top_tweets(middle, limit=args.page), args.repeat),
+                timed_ms(lambda: manager.top_tweets(middle, after=last_key, limit=args.page), args.repeat),
+                timed_ms(lambda: offset_query.all(), args.repeat),
+                timed_ms(manager.windows, args.repeat)))
+            manager.close()
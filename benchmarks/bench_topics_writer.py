@@ -0,0 +1,85 @@
+"""Compare writing a time period to the topics table with DataFrame.to_sql and with write_topics.
+
+Run from the root of the repo:
+
+    python -m benchmarks.bench_topics_writer --rows 100000 --engine_string sqlite:///data/bench_topics.db
+
+Each writer writes the same rows twice, as when a time period is rerun. to_sql appends, so the second run
+duplicates the rows, while write_topics replaces them. The table is dropped and created again before each
+writer. For sqlite, to_sql is given a sqlite3 connection to the same file, which pandas writes through the same
+driver as an engine.
+"""
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from src.add_topics_db import Base, create_db, write_topics
+
+DATE = '2020-01-15'
+
+
+def top_tweets(rows, random_state):
+    """Rows shaped like the output of create_topics_table."""
+    rng = np.random.default_rng(random_state)
+    return pd.DataFrame({'read_tweet_id': rng.choice(2 ** 62, size=rows, replace=False).astype(np.int64),
+                         'date': DATE,
+                         'topic_num': rng.integers(0, 20, size=rows),
+                         'prob': rng.random(rows),
+                         'tweet': ['tweet number %s about covid cases and lockdown' % i for i in range(rows)],
+                         'Perceived_susceptibility': rng.integers(0, 2, size=rows),
+                         'Perceived_severity': rng.integers(0, 2, size=rows),
+                         'Perceived_benefits': rng.integers(0, 2, size=rows),
+                         'Perceived_barriers': rng.integers(0, 2, size=rows)})
+
+
+def reset(engine):
+    """Drop and create the topics table."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def row_count(engine):
+    return engine.execute(sqlalchemy.text("SELECT COUNT(*) FROM topics")).scalar()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--engine_string', default='sqlite:///data/bench_topics.db',
+                        help="Database to write to, its topics table is dropped")
+    parser.add_argument('--batch_size', type=int, default=5000, help="Rows per insert of write_topics")
+    parser.add_argument('--random_state', type=int, default=66826)
+    args = parser.parse_args()
+
+    df = top_tweets(args.rows, args.random_state)
+    engine = create_db(args.engine_string)
+    to_sql_con = sqlite3.connect(engine.url.database) if engine.dialect.name == 'sqlite' else engine
+
+    writers = [
+        ('to_sql', lambda: df.to_sql(name='topics', con=to_sql_con, if_exists='append', index=False)),
+        ('to_sql multi', lambda: df.to_sql(name='topics', con=to_sql_con, if_exists='append', index=False,
+                                           method='multi', chunksize=max(1, 999 // len(df.columns)))),
+        ('write_topics', lambda: write_topics(engine, df, DATE, batch_size=args.batch_size)),
+    ]
+
+    print("%s rows, %s" % (args.rows, engine.dialect.name))
+    print("%-14s %12s %12s %14s" % ('writer', 'first s', 'rerun s', 'rows after'))
+    for name, write in writers:
+        reset(engine)
+        seconds = []
+        for _ in range(2):
+            start = time.perf_counter()
+            try:
+                write()
+            except Exception as e:
+                # to_sql cannot append a rerun to the primary key of the topics table
+                print("%-14s %12s %12s %14s" % (name, '%.2f' % seconds[0] if seconds else 'fails', 'fails', type(e).__name__))
+                break
+            seconds.append(time.perf_counter() - start)
+        else:
+            print("%-14s %12.2f %12.2f %14s" % (name, seconds[0], seconds[1], row_count(engine)))
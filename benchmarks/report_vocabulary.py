@@ -0,0 +1,61 @@
+"""Report how the vocabulary settings of create_dictionary change model size, training time and coherence.
+
+Run from the root of the repo:
+
+    python -m benchmarks.report_vocabulary --data_path data/sample/tweets.csv --repeat 50 --num_topics 8
+
+Every setting trains one model with the same seed. Coherence of a hashing dictionary is computed on the
+most frequent word of each bucket, so it only approximates the coherence of the full vocabulary.
+"""
+import argparse
+import string
+import time
+
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import clean_texts, get_stop_words, create_dictionary, CompactDocs
+from src.train_lda import fit_lda
+from src.coherence import CoherenceEngine
+
+SETTINGS = [
+    ('all words', {}),
+    ('no_below=2', {'no_below': 2}),
+    ('no_below=5', {'no_below': 5}),
+    ('no_below=2 no_above=0.5', {'no_below': 2, 'no_above': 0.5}),
+    ('keep_n=500', {'keep_n': 500}),
+    ('keep_n=200', {'keep_n': 200}),
+    ('hash_buckets=2000', {'hash_buckets': 2000}),
+    ('hash_buckets=500', {'hash_buckets': 500}),
+]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', default='data/sample/tweets.csv',
+                        help="Csv file with a read_text_clean2 column")
+    parser.add_argument('--repeat', type=int, default=50,
+                        help="Number of copies of the tweets in the corpus")
+    parser.add_argument('--num_topics', type=int, default=8)
+    parser.add_argument('--coherence', nargs='+', default=['c_v', 'u_mass'])
+    parser.add_argument('--random_state', type=int, default=66826)
+    args = parser.parse_args()
+
+    tweets = pd.read_csv(args.data_path, usecols=['read_text_clean2'])['read_text_clean2'].tolist() * args.repeat
+    docs = CompactDocs.from_texts(clean_texts(tweets, get_stop_words(), set(string.punctuation), WordNetLemmatizer(), tokenizer='regex'))
+
+    print("%s documents, %s tokens, %s distinct words" % (len(docs), len(docs.token_ids), len(docs.vocab)))
+    print("%-26s %8s %12s %9s" % ('setting', 'terms', 'model KB', 'seconds') + ''.join(' %9s' % c for c in args.coherence))
+    for name, vocabulary in SETTINGS:
+        dictionary, doc_term_matrix = create_dictionary(docs, **vocabulary)
+
+        start = time.perf_counter()
+        lda_model = fit_lda(doc_term_matrix, dictionary, args.num_topics, args.random_state)
+        seconds = time.perf_counter() - start
+
+        engine = CoherenceEngine(docs, dictionary)
+        scores = [engine.score_model(lda_model, coherence) for coherence in args.coherence]
+
+        print("%-26s %8s %12.1f %9.2f" % (name, len(dictionary), lda_model.expElogbeta.nbytes / 1e3, seconds)
+              + ''.join(' %9.4f' % score for score in scores))
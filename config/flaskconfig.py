@@ -8,6 +8,20 @@ HOST = "0.0.0.0"
 SQLALCHEMY_ECHO = False  # If true, SQL for queries made will be printed
 MAX_ROWS_SHOW = 100
 
+# Connection pool of the engine shared by the requests, see src/add_topics_db.get_engine (sizes are ignored for sqlite)
+DB_POOL = {'pool_size': 5, 'max_overflow': 10, 'pool_recycle': 3600, 'pool_pre_ping': True}
+
+# Saved lda models served by the app, at most MODEL_CACHE_SIZE loaded at once
+MODEL_DIR = os.environ.get('MODEL_DIR', 'models')
+MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', 4))
+
+# POST /score groups concurrent requests into batches of up to SCORE_MAX_BATCH_SIZE texts,
+# waiting at most SCORE_MAX_WAIT seconds for a batch to fill (see benchmarks/bench_score_endpoint.py)
+SCORE_MAX_BATCH_SIZE = int(os.environ.get('SCORE_MAX_BATCH_SIZE', 64))
+SCORE_MAX_WAIT = float(os.environ.get('SCORE_MAX_WAIT', 0.005))
+SCORE_TIMEOUT = 30
+SCORE_TOKENIZER = 'punkt'  # process_data.clean_text.tokenizer of config/model-meta.yaml
+
 # Connection string
 DB_HOST = os.environ.get('MYSQL_HOST')
 DB_PORT = os.environ.get('MYSQL_PORT')
@@ -23,14 +23,14 @@ from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from flask_sqlalchemy import SQLAlchemy
-from sklearn.model_selection import train_test_split
 
 
-from src.process_data import load_tweet_data, remove_duplicates, format_dates, timeframe, clean_text, create_dictionary
+from src.process_data import load_tweet_data, sample_tweet_data, remove_duplicates, format_dates, DateIndexedTweets, timeframe, clean_text, clean_texts, get_stop_words, create_dictionary
 from src.train_lda import topic_eval, get_max_k, get_doc_topic_matrix, create_topics_table, train_lda
 from src.viz_topics import create_word_clouds
 from src.add_topics_db import create_db, Topics
 from src.s3_upload import parse_s3, connect_s3
+from src.pipeline import get_windows, get_stage_cache, prepare_tweets, run_windows, update_window, rebuild_topic_summary
 import logging.config
 import config.config as config
 
@@ -61,6 +61,8 @@ if __name__ == '__main__':
                         help="If used, will download data from S3")
     parser.add_argument('--mysql', default=False,
                         help="If used, will download data from S3")
+    parser.add_argument('--recreate_tables', default=False, action='store_true',
+                        help="With --mysql, drop and create again a topics table created before its (date, read_tweet_id) key")
     parser.add_argument('--connect_type', default='download', 
                         help="If used, will download data from S3")
     parser.add_argument('--s3path', default='s3://2021-msia423-Hutch-Meghan/data/tweets.csv',
@@ -69,6 +71,12 @@ if __name__ == '__main__':
                         help="Where to load data to in S3")
     parser.add_argument('--model_train', default=False,
                         help="Run model")
+    parser.add_argument('--model_update', default=None,
+                        help="Saved model to update with the tweets of --update_data, e.g. models/lda_cov_model_2020-01-15")
+    parser.add_argument('--update_data', default=None,
+                        help="Csv of new tweets folded into the --model_update model")
+    parser.add_argument('--rebuild_summary', default=None,
+                        help="Fill the topic_summary table from the topic matrices of this folder, e.g. data/results")
     args = parser.parse_args()
     
     if args.s3:
@@ -80,78 +88,37 @@ if __name__ == '__main__':
         engine_string = f"{conn_type}://{user}:{password}@{host}:{port}/{db_name}"
 
         # create database for storing raw data
-        engine = create_db(engine_string)
+        engine = create_db(engine_string, recreate_outdated=args.recreate_tables, **config['database']['pool'])
 
         Session = sessionmaker(bind=engine)  
         session = Session()
     
     if args.model_train:
         
-        # Prepare methods for text processin
-        exclude = set(string.punctuation)
-        lemma = WordNetLemmatizer()
-
-        # create list of stop words
-        alphabet_remove = list(string.ascii_lowercase)
-        number_remove = list(range(0, 9999))
-        number_remove = map(str, number_remove) 
-        number_remove = list(number_remove)
-
-        stop_words_list = number_remove + alphabet_remove
-
-        # Process data
-        tweet_data = load_tweet_data(data_path = 'data/external/constructs.csv')
-        logger.debug("Randomly sample rows to reduce dataframe and speed up modeling.")
-        train, tweet_data = train_test_split(tweet_data, test_size=config['process_data']['sample_data']['test_size'], random_state=config['process_data']['sample_data']['random_state'])
-        
-        logger.info("Dataframe sampled with %s rows", len(tweet_data))
-        tweet_data = remove_duplicates(tweet_data)
-        tweet_data_formatted = format_dates(tweet_data)
-
-        # Run First Analysis.
-        logger.info("Running first analysis.")
-
-        tweet_data_subset, input_date = timeframe(tweet_data_formatted, input_date = config['process_data']['time_frame']['time_frame1'])
-        logging.info("Length of time sliced dataframe is %s rows", len(tweet_data_subset))
-
-        doc_clean = [clean_text(tweets, stop_words_list, exclude, lemma).split() for tweets in tweet_data_subset['read_text_clean2']]
-
-        dictionary, doc_term_matrix = create_dictionary(doc_clean)
-
-        max_k, cov_model, coherence_score, doc_topic_df, top_tweets, input_date = train_lda(doc_clean, doc_term_matrix, dictionary, top_k = config['tune_model']['k_topics'], input_date = config['process_data']['time_frame']['time_frame1'], tweet_df = tweet_data_subset, coherence_score_method = config['tune_model']['coherence_score_method'])
-
-        ## visualize model 
-        create_word_clouds(cov_model, input_date)
-
         logger.debug("Connect to mysql engine string.")
         engine_string = f"{conn_type}://{user}:{password}@{host}:{port}/{db_name}"
 
-        engine = create_db(engine_string)
-
-        logger.info("Save top_tweets table to MYSQL")
-        top_tweets.to_sql(name='topics', con=engine, if_exists = 'append', index=False)
-
-        # Run Second Analysis
-        logger.info("Running second analysis.")
-        tweet_data_subset, input_date = timeframe(tweet_data_formatted, input_date = config['process_data']['time_frame']['time_frame2'])
-        logging.info("Length of time sliced dataframe is %s rows", len(tweet_data_subset))
-
-        doc_clean = [clean_text(tweets, stop_words_list, exclude, lemma).split() for tweets in tweet_data_subset['read_text_clean2']]
-
-        dictionary, doc_term_matrix = create_dictionary(doc_clean)
-
-        max_k, cov_model, coherence_score, doc_topic_df, top_tweets, input_date = train_lda(doc_clean, doc_term_matrix, dictionary, top_k = config['tune_model']['k_topics'], input_date = config['process_data']['time_frame']['time_frame2'], tweet_df = tweet_data_subset, random_state = config['train_model']['random_state'], coherence_score_method = config['tune_model']['coherence_score_method'])
-
-        ## visualize model 
-        create_word_clouds(cov_model, input_date)
+        # Process data shared by every time frame
+        cache = get_stage_cache(config)
+        tweet_store, clean_key = prepare_tweets(config, cache = cache)
 
+        # Run the analysis of each time frame
+        windows = get_windows(config['process_data']['time_frame'])
+        results = run_windows(tweet_store, windows, config, engine_string, workers = config['pipeline']['workers'],
+                              cache = cache, clean_key = clean_key)
+        logger.info("Time frame results:\n%s", results)
+    
+    if args.model_update:
+        
+        # Fold the new tweets into the saved model, saving a new version of it
+        output_path = update_window(args.model_update, args.update_data, config)
+        logger.info("Updated model saved to %s", output_path)
+    
+    if args.rebuild_summary:
+        
         logger.debug("Connect to mysql engine string.")
         engine_string = f"{conn_type}://{user}:{password}@{host}:{port}/{db_name}"
-
-        engine = create_db(engine_string)
-
-        logger.info("Save top_tweets table to MYSQL")
-        top_tweets.to_sql(name='topics', con=engine, if_exists = 'append', index=False)
-
-        Session = sessionmaker(bind=engine)  
-        session = Session()
\ No newline at end of file
+        
+        # Backfill the topic summary of every time frame from the saved topic matrices
+        rows = rebuild_topic_summary(engine_string, config, results_dir = args.rebuild_summary)
+        logger.info("Topic summary rows per time frame: %s", rows)
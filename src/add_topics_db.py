@@ -1,8 +1,12 @@
+import os
+import threading
+
+import numpy as np
 import sqlalchemy
+import sqlalchemy.event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, MetaData
-from sqlalchemy.orm import sessionmaker
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, Integer, BigInteger, Float, String, MetaData, Index, and_, or_, func
+from sqlalchemy.orm import sessionmaker, scoped_session
 import logging.config
 
 # configure logger
@@ -17,11 +21,15 @@ class Topics(Base):
     """Create a data model for the database to store topics for time periods."""
 
     __tablename__ = 'topics'
+    # top tweets of a time period in the order of TopicManager.top_tweets, so a page is read from the index
+    __table_args__ = (Index('ix_topics_date_topic_prob', 'date', 'topic_num', sqlalchemy.desc('prob'), sqlalchemy.desc('read_tweet_id')),)
 
-    read_tweet_id = Column(Integer, primary_key=True)
-    date = Column(String(10), primary_key=False)
+    # a tweet can be a top tweet of several overlapping time periods
+    date = Column(String(10), primary_key=True)
+    read_tweet_id = Column(BigInteger, primary_key=True, autoincrement=False)
     topic_num = Column(Integer, primary_key=False)
-    prob = Column(Integer, primary_key=False)
+    # double precision, so the prob of a page key read back compares equal to the stored value
+    prob = Column(Float(precision=53), primary_key=False)
     tweet = Column(String(300), primary_key=False)
     Perceived_susceptibility = Column(Integer, primary_key=False)
     Perceived_severity = Column(Integer, primary_key=False)
@@ -31,43 +39,324 @@ class Topics(Base):
     def __repr__(self):
         return '<topics %r>' % self.topic
 
-def create_db(engine_string: str):
+class TopicSummary(Base):
+    """Create a data model for the counts of original annotations and tweets per topic of each time period."""
+
+    __tablename__ = 'topic_summary'
+
+    # the topics of a time period are read with one seek of the primary key
+    date = Column(String(10), primary_key=True)
+    topic_num = Column(Integer, primary_key=True, autoincrement=False)
+    Perceived_susceptibility = Column(Integer, primary_key=False)
+    Perceived_severity = Column(Integer, primary_key=False)
+    Perceived_benefits = Column(Integer, primary_key=False)
+    Perceived_barriers = Column(Integer, primary_key=False)
+    count = Column(Integer, primary_key=False)
+
+    def __repr__(self):
+        return '<topic_summary %r %r>' % (self.date, self.topic_num)
+
+# engines of this process by engine string, see get_engine
+_engines = {}
+_pool_stats = {}
+_engines_lock = threading.Lock()
+
+# pool options of the pools that hold a fixed number of connections, sqlite does not use one
+_SIZED_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+def _track_pool(engine, stats):
+    """Count the connections opened, checked out and returned by the pool of engine."""
+
+    @sqlalchemy.event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        stats['connects'] += 1
+
+    @sqlalchemy.event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        stats['checkouts'] += 1
+        stats['checked_out'] += 1
+        stats['peak_checked_out'] = max(stats['peak_checked_out'], stats['checked_out'])
+
+    @sqlalchemy.event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        stats['checkins'] += 1
+        stats['checked_out'] -= 1
+
+def _check_topics_schema(engine, recreate_outdated):
+    """Raise, or drop the table if recreate_outdated, when the topics table predates its (date, read_tweet_id) key.
+
+    create_all leaves existing tables as they are, and the rows written by write_topics need the current key.
+    """
+    inspector = sqlalchemy.inspect(engine)
+    if Topics.__tablename__ not in inspector.get_table_names():
+        return
+
+    key = inspector.get_pk_constraint(Topics.__tablename__)['constrained_columns']
+    if sorted(key) == ['date', 'read_tweet_id']:
+        return
+
+    if not recreate_outdated:
+        raise ValueError("The topics table of %r is keyed by %s instead of (date, read_tweet_id). Recreate it, dropping "
+                         "its rows, with run.py --mysql mysql --recreate_tables, or drop it." % (engine.url, key))
+
+    logger.warning("Drop the topics table of %r, keyed by %s, to create it again.", engine.url, key)
+    Topics.__table__.drop(engine)
+
+def get_engine(engine_string, pool_size=None, max_overflow=None, pool_timeout=None, pool_recycle=None, pool_pre_ping=None, recreate_outdated=False):
+    """Engine of a database, created once per process and engine string, with the tables and indexes created.
+
+    Later calls with the same engine string return the same engine and its pool of connections, whatever their
+    pool options. Engines are kept per process id, so worker processes forked after an engine was created open
+    their own connections instead of sharing the ones of their parent.
+
+    Args:
+        engine_string: str - Engine string.
+        pool_size: int - connections kept open in the pool, ignored for sqlite.
+        max_overflow: int - connections opened beyond pool_size when they are all checked out, ignored for sqlite.
+        pool_timeout: float - seconds to wait for a connection when the pool is exhausted, ignored for sqlite.
+        pool_recycle: int - seconds after which a connection is replaced, below the wait_timeout of MySQL.
+        pool_pre_ping: bool - test each connection on checkout and replace it if the database closed it.
+        recreate_outdated: bool - drop a topics table created before its current primary key instead of raising ValueError.
+
+    Returns:
+        engine: sqlalchemy.engine.base.Engine - shared engine of engine_string.
+    """
+    key = (os.getpid(), engine_string)
+
+    with _engines_lock:
+        if key in _engines:
+            return _engines[key]
+
+        options = dict(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout,
+                       pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping)
+        if sqlalchemy.engine.url.make_url(engine_string).get_backend_name() == 'sqlite':
+            options = {name: value for name, value in options.items() if name not in _SIZED_POOL_OPTIONS}
+
+        logger.debug("Create engine and tables.")
+        engine = sqlalchemy.create_engine(engine_string, **{name: value for name, value in options.items() if value is not None})
+
+        stats = {'connects': 0, 'checkouts': 0, 'checkins': 0, 'checked_out': 0, 'peak_checked_out': 0}
+        _track_pool(engine, stats)
+
+        _check_topics_schema(engine, recreate_outdated)
+        Base.metadata.create_all(engine)
+
+        # create_all skips the indexes of tables that already exist
+        existing = {index['name'] for index in sqlalchemy.inspect(engine).get_indexes(Topics.__tablename__)}
+        for index in Topics.__table__.indexes:
+            if index.name not in existing:
+                index.create(engine)
+
+        _engines[key] = engine
+        _pool_stats[key] = stats
+
+    logger.info("Engine created and tables checked for %r.", engine.url)
+
+    return engine
+
+def pool_stats():
+    """Connection pool statistics of the engines of this process.
+
+    Returns:
+        stats: dict - for each engine string (password hidden), counts of connections opened, checked out and
+            returned, connections checked out now and at most at once, and the status line of the pool.
+    """
+    with _engines_lock:
+        return {repr(engine.url): dict(_pool_stats[key], status=engine.pool.status())
+                for key, engine in _engines.items() if key[0] == os.getpid()}
+
+def create_db(engine_string: str, recreate_outdated=False, **pool_options):
     """Create database from provided engine string.
 
     Args:
         engine_string: str - Engine string.
+        recreate_outdated: bool - drop and create again a topics table with an outdated primary key.
+        pool_options: pool options of get_engine.
 
     Returns: 
         engine: sqlalchemy.engine.base.Engine - sqlalchemy connection from amazon rds  
 
     """
-    logger.debug("Create table and columns for raw data.")
-    engine = sqlalchemy.create_engine(engine_string)
-
-    Base.metadata.create_all(engine)
     logger.debug("Attempting to create database from engine string.")
+    engine = get_engine(engine_string, recreate_outdated=recreate_outdated, **pool_options)
     logger.info("Database created.")
     
     return engine
 
+def _replace_window(engine, table, df, input_date, batch_size):
+    """Replace the rows of table dated input_date with the rows of df, in one transaction."""
+    
+    columns = [column.name for column in table.columns if column.name in df.columns]
+    
+    # python values column by column, None instead of NaN
+    values = {}
+    for column in columns:
+        values[column] = df[column].tolist()
+        missing = df[column].isna().to_numpy()
+        for i in np.flatnonzero(missing):
+            values[column][i] = None
+    
+    rows = [dict(zip(columns, row)) for row in zip(*(values[column] for column in columns))]
+    
+    logger.debug("Replace the %s rows of %s in the %s table.", len(rows), input_date, table.name)
+    
+    with engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.date == input_date))
+        # a list of parameters runs one executemany per batch, which pymysql sends as a multi-row insert
+        for start in range(0, len(rows), batch_size):
+            connection.execute(table.insert(), rows[start:start + batch_size])
+    
+    logger.info("%s rows of %s written to the %s table.", len(rows), input_date, table.name)
+    
+    return len(rows)
+
+def write_topics(engine, top_tweets, input_date, batch_size=5000):
+    """Replace the rows of a time period in the topics table with top_tweets, in one transaction.
+    
+    The rows of input_date are deleted and top_tweets inserted in batches of batch_size rows, so 
+    rerunning a time period replaces its rows instead of appending duplicates, and readers see either the old or 
+    the new rows.
+    
+    Args:
+        engine: sqlalchemy.engine.base.Engine - engine of the database, sqlite or mysql.
+        top_tweets: dataframe - output of create_topics_table, with the columns of Topics.
+        input_date: str - time period of top_tweets.
+        batch_size: int - rows per insert statement.
+    
+    Returns:
+        rows: int - number of rows written.
+    """
+    
+    return _replace_window(engine, Topics.__table__, top_tweets, input_date, batch_size)
+
+def write_topic_summary(engine, doc_topic_matrix, input_date):
+    """Replace the rows of a time period in the topic_summary table with its doc_topic_matrix, in one transaction.
+    
+    Args:
+        engine: sqlalchemy.engine.base.Engine - engine of the database, sqlite or mysql.
+        doc_topic_matrix: dataframe - construct and tweet counts per topic_num, see train_lda.count_topic_constructs.
+        input_date: str - time period of doc_topic_matrix.
+    
+    Returns:
+        rows: int - number of rows written.
+    """
+    
+    return _replace_window(engine, TopicSummary.__table__, doc_topic_matrix.assign(date=input_date), input_date, batch_size=5000)
+
 class TopicManager:
 
-    def __init__(self, app=None, engine_string=None):
+    def __init__(self, app=None, engine_string=None, **pool_options):
         """
         Args:
-            app: Flask - Flask app
+            app: Flask - Flask app, its SQLALCHEMY_DATABASE_URI and DB_POOL options are used.
             engine_string: str - Engine string
+            pool_options: pool options of get_engine, when engine_string is given.
         """
         if app:
-            self.db = SQLAlchemy(app)
-            self.session = self.db.session
+            engine = get_engine(app.config["SQLALCHEMY_DATABASE_URI"], **app.config.get("DB_POOL", {}))
+            # one session per request thread, returned to the pool at the end of the request
+            self.session = scoped_session(sessionmaker(bind=engine))
+            app.teardown_appcontext(lambda exception: self.session.remove())
         elif engine_string:
-            engine = sqlalchemy.create_engine(engine_string)
+            engine = get_engine(engine_string, **pool_options)
             Session = sessionmaker(bind=engine)
             self.session = Session()
         else:
             raise ValueError("Need either an engine string or a Flask app to initialize")
 
+    def windows(self, after=None, limit=None):
+        """Dates of the time periods in the topics table, in order.
+        
+        Each date is found with one seek of the primary key, so the cost grows with the number of time periods
+        returned rather than with the number of rows.
+        
+        Args:
+            after: str - only return dates after this one, e.g. the last date of a previous page.
+            limit: int - maximum number of dates, None returns all of them.
+        
+        Returns:
+            dates: list - dates of the time periods.
+        """
+        dates = []
+        
+        while limit is None or len(dates) < limit:
+            query = self.session.query(func.min(Topics.date))
+            if after is not None:
+                query = query.filter(Topics.date > after)
+            after = query.scalar()
+            if after is None:
+                break
+            dates.append(after)
+        
+        return dates
+    
+    def topic_nums(self, date):
+        """Topic numbers of a time period, in order, one index seek per topic.
+        
+        Args:
+            date: str - date of the time period.
+        
+        Returns:
+            topic_nums: list - topic numbers with top tweets in the time period.
+        """
+        topic_nums = []
+        
+        while True:
+            query = self.session.query(func.min(Topics.topic_num)).filter(Topics.date == date)
+            if topic_nums:
+                query = query.filter(Topics.topic_num > topic_nums[-1])
+            topic_num = query.scalar()
+            if topic_num is None:
+                return topic_nums
+            topic_nums.append(topic_num)
+    
+    def top_tweets(self, date, topic_num=None, after=None, limit=100):
+        """A page of the top tweets of a time period, by topic then by decreasing probability.
+        
+        Pages are found with keyset pagination: the next page starts after the key of the last row of the
+        previous one, so every page is read from ix_topics_date_topic_prob at the same cost, however deep.
+        
+        Args:
+            date: str - date of the time period.
+            topic_num: int - only return the tweets of this topic, None returns all topics.
+            after: tuple - (topic_num, prob, read_tweet_id) key returned with the previous page, None starts at the first page.
+            limit: int - maximum number of rows of the page.
+        
+        Returns:
+            rows: list - Topics rows of the page.
+            next_key: tuple - key to pass as after for the next page, None on the last page.
+        """
+        query = self.session.query(Topics).filter(Topics.date == date)
+        
+        if topic_num is not None:
+            query = query.filter(Topics.topic_num == topic_num)
+        
+        if after is not None:
+            last_topic, last_prob, last_id = after
+            query = query.filter(or_(Topics.topic_num > last_topic,
+                                     and_(Topics.topic_num == last_topic,
+                                          or_(Topics.prob < last_prob,
+                                              and_(Topics.prob == last_prob, Topics.read_tweet_id < last_id)))))
+        
+        rows = query.order_by(Topics.topic_num, Topics.prob.desc(), Topics.read_tweet_id.desc()).limit(limit).all()
+        
+        next_key = None
+        if rows and len(rows) == limit:
+            next_key = (rows[-1].topic_num, rows[-1].prob, rows[-1].read_tweet_id)
+        
+        return rows, next_key
+    
+    def topic_summary(self, date):
+        """Counts of original annotations and tweets per topic of a time period.
+        
+        Args:
+            date: str - date of the time period.
+        
+        Returns:
+            rows: list - TopicSummary rows of the time period, by topic_num.
+        """
+        return self.session.query(TopicSummary).filter(TopicSummary.date == date).order_by(TopicSummary.topic_num).all()
+    
     def close(self) -> None:
         """Closes session
         Returns: None
@@ -0,0 +1,145 @@
+import os
+import json
+import pickle
+import hashlib
+import logging.config
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+def file_fingerprint(path):
+    """Identify the contents of a file by its path, size and modification time.
+
+    Args:
+        path: str - path of the file.
+
+    Returns:
+        fingerprint: list - absolute path, size in bytes and modification time, None for a missing file.
+    """
+
+    if not os.path.exists(path):
+        return [os.path.abspath(path), None, None]
+
+    stat = os.stat(path)
+
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+class StageCache:
+    """Content-addressed checkpoints of pipeline stages, stored as pickles in a size-bounded directory.
+
+    Each stage is keyed by a hash of its inputs and config, usually including the key of the stage it
+    depends on, so a rerun resumes from the first stage whose inputs changed. When the directory grows past
+    max_bytes, the least recently used checkpoints are removed.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, enabled=True):
+        """
+        Args:
+            cache_dir: str - directory holding the checkpoints.
+            max_bytes: int - maximum total size of the checkpoints, None for no limit.
+            enabled: bool - if False, every stage is computed and nothing is stored.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """Hash the json-serializable inputs of a stage into a key.
+
+        Args:
+            parts: inputs and config of the stage, e.g. the key of the previous stage and a config section.
+
+        Returns:
+            key: str - hex digest identifying the inputs.
+        """
+        payload = json.dumps(parts, sort_keys=True, default=str)
+
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, '%s-%s.pkl' % (stage, key))
+
+    def get_or_compute(self, stage, key, compute):
+        """Load the checkpoint of a stage, or compute and store it.
+
+        Args:
+            stage: str - name of the stage, e.g. 'tweets'.
+            key: str - key of the stage inputs, see StageCache.key.
+            compute: function - called without arguments to produce the stage output on a miss.
+
+        Returns:
+            output: output of the stage.
+        """
+        if not self.enabled:
+            return compute()
+
+        path = self._path(stage, key)
+
+        try:
+            with open(path, 'rb') as f:
+                output = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            logger.info("No checkpoint for stage %s, computing it.", stage)
+        else:
+            logger.info("Stage %s loaded from checkpoint %s", stage, path)
+            # mark as recently used for eviction
+            os.utime(path)
+            return output
+
+        output = compute()
+
+        # write to a temporary file so that concurrent readers never see a partial checkpoint
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        logger.debug("Stage %s saved to checkpoint %s", stage, path)
+
+        self.evict()
+
+        return output
+
+    def evict(self):
+        """Remove the least recently used checkpoints until the directory fits in max_bytes.
+
+        Returns:
+            removed: list - paths of the removed checkpoints.
+        """
+        if not self.enabled or self.max_bytes is None:
+            return []
+
+        checkpoints = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            checkpoints.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in checkpoints)
+        removed = []
+
+        for _, size, path in sorted(checkpoints):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed.append(path)
+
+        if removed:
+            logger.info("Evicted %s checkpoints from %s", len(removed), self.cache_dir)
+
+        return removed
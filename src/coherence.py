@@ -0,0 +1,102 @@
+import logging.config
+
+from gensim.models.coherencemodel import CoherenceModel
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+class CoherenceEngine:
+    """Score many topic models of the same texts while gathering word statistics only once per measure.
+
+    A gensim CoherenceModel scans the texts for the (co-)occurrences of the top words of its topics. The engine
+    builds one CoherenceModel per measure for the union of the top words of every topic it is prepared for, then
+    swaps in the topics of each model to score. Occurrence counts do not depend on which other words are tracked,
+    so the scores are identical to building a new CoherenceModel per model.
+    """
+
+    def __init__(self, texts, dictionary, topn=20, processes=-1):
+        """
+        Args:
+            texts: list - cleaned tokens of each document.
+            dictionary: corpora.dictionary - dictionary mapping each term to it's integer id.
+            topn: int - number of top words of each topic that are scored.
+            processes: int - number of processes used to gather the statistics, see gensim's CoherenceModel.
+        """
+        self.texts = texts
+        self.dictionary = dictionary
+        self.topn = topn
+        self.processes = processes
+        self._coherence_models = {}
+        self._relevant_words = {}
+        self.passes = {}
+
+    def model_topics(self, lda_model):
+        """Return the top words of each topic of a trained model.
+
+        Args:
+            lda_model: lda object - trained lda model object.
+
+        Returns:
+            topics: list - list of the topn words of each topic.
+        """
+        return CoherenceModel.top_topics_as_word_lists(lda_model, self.dictionary, self.topn)
+
+    def prepare(self, topics_per_model, coherence='c_v'):
+        """Gather the statistics of a measure for the top words of several models in one pass over the texts.
+
+        Nothing is gathered if the statistics of every word were already gathered for the measure.
+
+        Args:
+            topics_per_model: list - for each model, the list of top words of each of its topics.
+            coherence: str - gensim coherence measure, e.g. 'c_v', 'u_mass' or 'c_npmi'.
+        """
+        prepared = self._relevant_words.get(coherence, set())
+        relevant_words = set(prepared)
+        for topics in topics_per_model:
+            for topic in topics:
+                relevant_words.update(topic)
+
+        if coherence in self._coherence_models and relevant_words == prepared:
+            return
+
+        logger.debug("Gather %s statistics for %s relevant words.", coherence, len(relevant_words))
+
+        cm = CoherenceModel.for_topics([[sorted(relevant_words)]], dictionary=self.dictionary, texts=self.texts,
+                                       coherence=coherence, topn=self.topn, processes=self.processes)
+
+        self._coherence_models[coherence] = cm
+        self._relevant_words[coherence] = relevant_words
+        self.passes[coherence] = self.passes.get(coherence, 0) + 1
+
+    def score(self, topics, coherence='c_v'):
+        """Score a list of topics, gathering statistics first if some of their words were not prepared.
+
+        Args:
+            topics: list - list of top words of each topic, e.g. from model_topics.
+            coherence: str - gensim coherence measure, e.g. 'c_v', 'u_mass' or 'c_npmi'.
+
+        Returns:
+            score: float - coherence of the topics.
+        """
+        words = {word for topic in topics for word in topic}
+
+        if not words <= self._relevant_words.get(coherence, set()):
+            self.prepare([topics], coherence)
+
+        cm = self._coherence_models[coherence]
+        cm.topics = topics
+
+        return cm.get_coherence()
+
+    def score_model(self, lda_model, coherence='c_v'):
+        """Score a trained model, see score.
+
+        Args:
+            lda_model: lda object - trained lda model object.
+            coherence: str - gensim coherence measure, e.g. 'c_v', 'u_mass' or 'c_npmi'.
+
+        Returns:
+            score: float - coherence of the model.
+        """
+        return self.score(self.model_topics(lda_model), coherence)
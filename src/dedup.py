@@ -0,0 +1,247 @@
+import re
+import logging.config
+
+import numpy as np
+import pandas as pd
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+# links, handles and the retweet marker do not change what a tweet says
+_NOISE_PATTERN = re.compile(r'https?://\S+|www\.\S+|@\w+|\brt\b')
+_WORD_PATTERN = re.compile(r'\w+')
+
+def _mix64(x):
+    """Scramble uint64 values with the splitmix64 finalizer, used as a family of hash functions."""
+
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return x ^ (x >> np.uint64(31))
+
+def _contains(sorted_values, values):
+    """Whether each of values is in the sorted array sorted_values."""
+
+    positions = np.searchsorted(sorted_values, values)
+    found = positions < len(sorted_values)
+    found[found] = sorted_values[positions[found]] == values[found]
+
+    return found
+
+def _add_run(runs, run, merge):
+    """Append a run of sorted arrays, merging it into the runs before it while they are not larger.
+
+    The runs keep geometric sizes, so there are O(log n) of them to search and each value is merged O(log n)
+    times, instead of every value being sorted again for each chunk.
+    """
+    while runs and len(runs[-1][0]) <= len(run[0]):
+        run = merge(runs.pop(), run)
+    runs.append(run)
+
+def lsh_bands(num_perm, threshold):
+    """Split a MinHash signature into bands so that tweets about `threshold` similar are likely to share a band.
+
+    Two tweets with Jaccard similarity s share at least one of b bands of r rows with probability
+    1 - (1 - s^r)^b, which rises steeply around s = (1/b)^(1/r).
+
+    Args:
+        num_perm: int - length of the MinHash signature.
+        threshold: float - Jaccard similarity above which tweets are near duplicates.
+
+    Returns:
+        bands: int - number of bands.
+        rows: int - signature values per band.
+    """
+
+    rows = min((r for r in range(1, num_perm + 1) if num_perm % r == 0),
+               key=lambda r: abs((r / num_perm) ** (1 / r) - threshold))
+
+    return num_perm // rows, rows
+
+class StreamingDeduplicator:
+    """Remove exact and near duplicate tweets from a stream of chunks, in one pass.
+
+    Exact duplicates share the 64-bit hash of their text. Near duplicates, such as a retweet with a trailing
+    handle or link, are found with MinHash signatures of the word pairs of their normalized text: locality
+    sensitive hashing finds candidate pairs, which are kept apart unless their estimated Jaccard similarity
+    reaches the threshold. Only hashes of the kept tweets are remembered, 8 bytes for the text plus
+    4 * num_perm + 16 * bands bytes for near duplicates, whatever the length of the tweets or the chunks, so
+    memory grows linearly with the number of kept tweets. They are held in sorted runs of geometric sizes,
+    searched with np.searchsorted, so that a chunk costs O(log n) searches rather than a sort of all n kept tweets.
+
+    The first occurrence is kept. An instance is a row_filter of load_tweet_data and sample_tweet_data.
+    """
+
+    def __init__(self, column='read_text_clean2', near_duplicates=True, threshold=0.8, num_perm=64, random_state=66826, block_size=5000):
+        """
+        Args:
+            column: str - column holding the text of the tweets.
+            near_duplicates: bool - if False, only exact duplicates are removed.
+            threshold: float - Jaccard similarity of word pairs above which tweets are near duplicates.
+            num_perm: int - number of hash functions of the MinHash signatures.
+            random_state: int - seed of the hash functions.
+            block_size: int - number of tweets whose signatures are computed at once, bounds the working memory.
+        """
+        self.column = column
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.block_size = block_size
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(random_state)
+        self._perm_seeds = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._band_seeds = rng.integers(0, 2 ** 63, size=self.bands, dtype=np.uint64)
+
+        # runs of sorted hashes of the kept texts
+        self._text_runs = []
+        # runs of sorted band keys of the kept tweets, the tweet of each key and the truncated signature of each tweet of the run
+        self._band_runs = []
+        self.counts = {'rows': 0, 'exact': 0, 'near': 0}
+
+    def _shingles(self, texts):
+        """Hashes of the word pairs of each normalized text, and the number of pairs per text."""
+
+        shingles = []
+        lengths = np.zeros(len(texts), dtype=np.int64)
+
+        for i, text in enumerate(texts):
+            words = _WORD_PATTERN.findall(_NOISE_PATTERN.sub(' ', str(text).lower()))
+            pairs = [' '.join(pair) for pair in zip(words, words[1:])] or words
+            shingles.extend(pairs)
+            lengths[i] = len(pairs)
+
+        return pd.util.hash_array(np.asarray(shingles, dtype=object)), lengths
+
+    def signatures(self, texts):
+        """MinHash signatures of texts.
+
+        Args:
+            texts: list - text of each tweet.
+
+        Returns:
+            signatures: np.ndarray - (tweets x num_perm) uint64 signatures, rows of texts without words are all zeros.
+            has_words: np.ndarray - whether each text has at least one word.
+        """
+        shingles, lengths = self._shingles(texts)
+        has_words = lengths > 0
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        signatures = np.zeros((len(texts), self.num_perm), dtype=np.uint64)
+        rows = np.flatnonzero(has_words)
+
+        for i in range(0, len(rows), self.block_size):
+            block = rows[i:i + self.block_size]
+            lo, hi = starts[block[0]], starts[block[-1]] + lengths[block[-1]]
+            hashed = _mix64(shingles[lo:hi, None] ^ self._perm_seeds[None, :])
+            signatures[block] = np.minimum.reduceat(hashed, starts[block] - lo, axis=0)
+
+        return signatures, has_words
+
+    def _band_keys(self, signatures):
+        """Hash each band of the signatures into one uint64 key, distinct across bands."""
+
+        keys = np.empty((len(signatures), self.bands), dtype=np.uint64)
+
+        for band in range(self.bands):
+            key = np.full(len(signatures), self._band_seeds[band], dtype=np.uint64)
+            for row in range(band * self.rows, (band + 1) * self.rows):
+                key = _mix64(key ^ signatures[:, row])
+            keys[:, band] = key
+
+        return keys
+
+    def _similar(self, signatures, docs, others):
+        """Whether the signatures of docs and others estimate a Jaccard similarity of at least threshold."""
+
+        return (signatures[docs] == others).mean(axis=1) >= self.threshold
+
+    def _near_duplicates(self, texts):
+        """Flag the texts similar to a kept tweet or to an earlier text of the same chunk, and remember the others."""
+
+        signatures, has_words = self.signatures(texts)
+        signatures = signatures.astype(np.uint32)
+        band_keys = self._band_keys(signatures)
+
+        # band keys of the texts with words, in text order
+        docs = np.repeat(np.flatnonzero(has_words), self.bands)
+        keys = band_keys[has_words].ravel()
+        near = np.zeros(len(texts), dtype=bool)
+
+        # candidates among the kept tweets
+        for band_hashes, band_docs, kept_signatures in self._band_runs:
+            positions = np.searchsorted(band_hashes, keys)
+            found = positions < len(band_hashes)
+            found[found] = band_hashes[positions[found]] == keys[found]
+            candidates = kept_signatures[band_docs[positions[found]]]
+            near[docs[found][self._similar(signatures, docs[found], candidates)]] = True
+
+        # candidates among earlier texts of the chunk, compared to the first text sharing the band key
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        heads = order[np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))]
+        later, heads = docs[order[~first]], docs[heads[~first]]
+        near[later[self._similar(signatures, later, signatures[heads])]] = True
+
+        kept = ~near & has_words
+        band_hashes = band_keys[kept].ravel()
+        order = np.argsort(band_hashes, kind='stable')
+        run = (band_hashes[order], np.repeat(np.arange(kept.sum()), self.bands)[order], signatures[kept])
+        _add_run(self._band_runs, run, self._merge_band_runs)
+
+        return near
+
+    @staticmethod
+    def _merge_band_runs(first, second):
+        """Merge two runs of band keys, numbering the tweets of second after those of first."""
+
+        band_hashes = np.concatenate([first[0], second[0]])
+        band_docs = np.concatenate([first[1], second[1] + len(first[2])])
+        order = np.argsort(band_hashes, kind='stable')
+
+        return band_hashes[order], band_docs[order], np.concatenate([first[2], second[2]])
+
+    def __call__(self, chunk):
+        """Drop the tweets of a chunk that duplicate a tweet kept so far.
+
+        Args:
+            chunk: dataframe - tweets with the text column.
+
+        Returns:
+            chunk: dataframe - the tweets that are not duplicates.
+        """
+        self.counts['rows'] += len(chunk)
+
+        text_hashes = pd.util.hash_pandas_object(chunk[self.column], index=False).to_numpy()
+        exact = pd.Series(text_hashes).duplicated().to_numpy(copy=True)
+        for (kept_hashes,) in self._text_runs:
+            exact |= _contains(kept_hashes, text_hashes)
+        self.counts['exact'] += int(exact.sum())
+
+        chunk = chunk[~exact]
+        text_hashes = text_hashes[~exact]
+
+        if self.near_duplicates and len(chunk):
+            near = self._near_duplicates(chunk[self.column].tolist())
+            self.counts['near'] += int(near.sum())
+
+            chunk = chunk[~near]
+            text_hashes = text_hashes[~near]
+
+        _add_run(self._text_runs, (np.sort(text_hashes),), lambda first, second: (np.union1d(first[0], second[0]),))
+
+        return chunk
+
+    def report(self):
+        """Log and return how many rows each method removed.
+
+        Returns:
+            counts: dict - rows seen and rows removed as exact and near duplicates.
+        """
+        logger.info("%s of %s rows removed, %s exact and %s near duplicates.", self.counts['exact'] + self.counts['near'],
+                    self.counts['rows'], self.counts['exact'], self.counts['near'])
+
+        return dict(self.counts)
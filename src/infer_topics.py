@@ -0,0 +1,262 @@
+import os
+import json
+import zlib
+import pickle
+import logging.config
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+def _digamma(x):
+    """Digamma function of positive values: the asymptotic series at x + 6, shifted back by the recurrence."""
+
+    x = np.asarray(x, dtype=np.float64)
+    shift = 1 / x + 1 / (x + 1) + 1 / (x + 2) + 1 / (x + 3) + 1 / (x + 4) + 1 / (x + 5)
+    x = x + 6
+
+    inv2 = 1 / (x * x)
+
+    return np.log(x) - 0.5 / x - inv2 * (1 / 12 - inv2 * (1 / 120 - inv2 * (1 / 252 - inv2 * (1 / 240 - inv2 / 132)))) - shift
+
+def _dirichlet_expectation(gamma):
+    """Expected log of theta ~ Dirichlet(gamma), for each row of gamma."""
+
+    return _digamma(gamma) - _digamma(gamma.sum(axis=1))[:, None]
+
+def export_inference_arrays(lda_model, model_path):
+    """Save the vocabulary and alpha of a model next to its expElogbeta.npy, so TopicInferencer loads it without gensim.
+
+    Args:
+        lda_model: lda object - trained lda model object.
+        model_path: str - path the model was saved to, e.g. 'models/lda_cov_model_2020-01-15'.
+    """
+
+    dictionary = lda_model.id2word
+
+    # a hashing dictionary has no list of words, only its number of buckets
+    if hasattr(dictionary, 'restricted_hash'):
+        vocab = {'hash_buckets': len(dictionary)}
+    else:
+        tokens = [None] * lda_model.num_terms
+        for token, tokenid in dictionary.token2id.items():
+            tokens[tokenid] = token
+        vocab = {'tokens': tokens}
+
+    with open(model_path + '.vocab.json', 'w') as f:
+        json.dump(vocab, f)
+
+    np.save(model_path + '.alpha.npy', np.asarray(lda_model.alpha, dtype=np.float64))
+
+    logger.debug("Inference arrays of %s saved.", model_path)
+
+class TopicInferencer:
+    """Topic distributions of new documents from the arrays of a saved lda model, using numpy only.
+
+    Runs the variational E-step of gensim's LdaModel.inference on a whole batch of documents at once, as array
+    operations over all the words of the batch. Each document stops updating once its mean change in gamma falls
+    below gamma_threshold, as in gensim. gensim starts each document from a random gamma while this starts from
+    the same constant, so results agree within the convergence tolerance.
+    """
+
+    def __init__(self, expElogbeta, alpha, token2id=None, hash_buckets=None, iterations=50, gamma_threshold=0.001,
+                 minimum_probability=0.01, batch_size=5000):
+        """
+        Args:
+            expElogbeta: np.ndarray - (topics x terms) exp of the expected log topic-word distributions.
+            alpha: np.ndarray - Dirichlet prior of the topics of a document.
+            token2id: dict - id of each word, words missing from it are ignored.
+            hash_buckets: int - for a model trained with a hashing dictionary, the number of buckets, instead of token2id.
+            iterations: int - maximum number of E-step iterations.
+            gamma_threshold: float - mean change of gamma under which a document has converged.
+            minimum_probability: float - topics with a lower probability are left out of get_document_topics.
+            batch_size: int - number of documents inferred at once.
+        """
+        self.expElogbeta = expElogbeta
+        self.alpha = np.asarray(alpha, dtype=np.float64)
+        self.token2id = token2id
+        self.hash_buckets = hash_buckets
+        self.iterations = iterations
+        self.gamma_threshold = gamma_threshold
+        self.minimum_probability = max(minimum_probability, 1e-8)
+        self.batch_size = batch_size
+        self.num_topics = expElogbeta.shape[0]
+
+    @classmethod
+    def load(cls, model_path, mmap_mode=None, **kwargs):
+        """Load the inference arrays of a saved model.
+
+        Uses the files of export_inference_arrays when present, otherwise unpickles the .id2word and model files,
+        which imports gensim.
+
+        Args:
+            model_path: str - path of the saved model, e.g. 'models/lda_cov_model_2020-01-15'.
+            mmap_mode: str - mmap_mode of np.load for expElogbeta, e.g. 'r' to share it between processes.
+            kwargs: other arguments of TopicInferencer.
+
+        Returns:
+            inferencer: TopicInferencer - inferencer of the model.
+        """
+        expElogbeta = np.load(model_path + '.expElogbeta.npy', mmap_mode=mmap_mode)
+
+        if os.path.exists(model_path + '.vocab.json') and os.path.exists(model_path + '.alpha.npy'):
+            with open(model_path + '.vocab.json') as f:
+                vocab = json.load(f)
+            alpha = np.load(model_path + '.alpha.npy')
+        else:
+            logger.info("No inference arrays for %s, unpickling the gensim model.", model_path)
+
+            with open(model_path + '.id2word', 'rb') as f:
+                dictionary = pickle.load(f)
+            with open(model_path, 'rb') as f:
+                alpha = pickle.load(f).alpha
+
+            if hasattr(dictionary, 'restricted_hash'):
+                vocab = {'hash_buckets': len(dictionary)}
+            else:
+                vocab = {'tokens': sorted(dictionary.token2id, key=dictionary.token2id.get)}
+
+        if 'hash_buckets' in vocab:
+            return cls(expElogbeta, alpha, hash_buckets=vocab['hash_buckets'], **kwargs)
+
+        return cls(expElogbeta, alpha, token2id={token: i for i, token in enumerate(vocab['tokens'])}, **kwargs)
+
+    def doc2bow(self, document):
+        """Bag of words of a list of tokens, as the dictionary of the model would compute it.
+
+        Args:
+            document: list - tokens of a cleaned document.
+
+        Returns:
+            bow: list - (term id, count) pairs sorted by term id.
+        """
+        counts = Counter()
+
+        for token, count in Counter(document).items():
+            term_id = self._term_id(token)
+            if term_id >= 0:
+                counts[term_id] += count
+
+        return sorted(counts.items())
+
+    def _term_id(self, token):
+        """Id of a token in the model, -1 for words the model does not know."""
+
+        if self.hash_buckets is not None:
+            return zlib.adler32(token.encode('utf-8')) % self.hash_buckets
+
+        return self.token2id.get(token, -1)
+
+    def _flatten(self, documents):
+        """(document, term id, count) arrays of the known words of a batch, sorted by document and term.
+
+        Tokens are mapped to ids once per distinct token of the batch rather than once per occurrence.
+        """
+        bow_docs, bow_pairs, token_docs, tokens = [], [], [], []
+
+        for i, doc in enumerate(documents):
+            if doc and isinstance(doc[0], tuple):
+                bow_docs.extend([i] * len(doc))
+                bow_pairs.extend(doc)
+            else:
+                token_docs.extend([i] * len(doc))
+                tokens.extend(doc)
+
+        codes, uniques = pd.factorize(np.asarray(tokens, dtype=object))
+        token_ids = np.fromiter((self._term_id(token) for token in uniques), dtype=np.int64, count=len(uniques))[codes]
+        known = token_ids >= 0
+
+        pairs = np.asarray(bow_pairs, dtype=np.float64).reshape(-1, 2)
+        docs = np.concatenate([np.asarray(bow_docs, dtype=np.int64), np.asarray(token_docs, dtype=np.int64)[known]])
+        terms = np.concatenate([pairs[:, 0].astype(np.int64), token_ids[known]])
+        counts = np.concatenate([pairs[:, 1], np.ones(known.sum())])
+
+        # add up the counts of each word of each document
+        keys, inverse = np.unique(docs * self.expElogbeta.shape[1] + terms, return_inverse=True)
+
+        return keys // self.expElogbeta.shape[1], keys % self.expElogbeta.shape[1], np.bincount(inverse, weights=counts, minlength=len(keys))
+
+    def _infer_batch(self, documents):
+        """Gamma of a batch of documents.
+
+        The words of the batch are kept as flat (document, term, count) arrays, so an iteration costs
+        (words in the batch x topics) whatever the size of the vocabulary.
+        """
+        n_docs = len(documents)
+        docs, terms, counts = self._flatten(documents)
+
+        # expElogbeta of the topics of every word of the batch, (words x topics)
+        word_topics = np.asarray(self.expElogbeta[:, terms], dtype=np.float64).T
+        epsilon = np.finfo(self.expElogbeta.dtype).eps
+
+        gamma = np.ones((n_docs, self.num_topics))
+        expElogtheta = np.exp(_dirichlet_expectation(gamma))
+        active = np.ones(n_docs, dtype=bool)
+
+        for _ in range(self.iterations):
+            words = active[docs]
+            word_docs = docs[words]
+
+            phinorm = (expElogtheta[word_docs] * word_topics[words]).sum(axis=1) + epsilon
+            contributions = (counts[words] / phinorm)[:, None] * word_topics[words]
+            weighted = np.stack([np.bincount(word_docs, weights=contributions[:, k], minlength=n_docs)
+                                 for k in range(self.num_topics)], axis=1)
+
+            new_gamma = self.alpha + expElogtheta[active] * weighted[active]
+            change = np.abs(new_gamma - gamma[active]).mean(axis=1)
+
+            gamma[active] = new_gamma
+            expElogtheta[active] = np.exp(_dirichlet_expectation(new_gamma))
+
+            # documents that converged keep their gamma, as gensim stops iterating them
+            active[np.flatnonzero(active)[change < self.gamma_threshold]] = False
+            if not active.any():
+                break
+
+        return gamma
+
+    def infer(self, documents):
+        """Variational gamma of each document.
+
+        Args:
+            documents: list - list of tokens, or bag of words, of each document.
+
+        Returns:
+            gamma: np.ndarray - (documents x topics) variational Dirichlet parameters.
+        """
+        gamma = np.zeros((len(documents), self.num_topics))
+
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            gamma[start:start + len(batch)] = self._infer_batch(batch)
+
+        return gamma
+
+    def topic_matrix(self, documents):
+        """Topic distribution of each document.
+
+        Args:
+            documents: list - list of tokens, or bag of words, of each document.
+
+        Returns:
+            doc_topic_probs: np.ndarray - (documents x topics) matrix of topic probabilities.
+        """
+        gamma = self.infer(documents)
+
+        return gamma / gamma.sum(axis=1, keepdims=True)
+
+    def get_document_topics(self, documents):
+        """Topics of each document above minimum_probability, like gensim's get_document_topics.
+
+        Args:
+            documents: list - list of tokens, or bag of words, of each document.
+
+        Returns:
+            doc_topics: list - for each document, a list of (topic, probability) pairs.
+        """
+        return [[(topic, float(prob)) for topic, prob in enumerate(row) if prob >= self.minimum_probability]
+                for row in self.topic_matrix(documents)]
@@ -0,0 +1,130 @@
+import os
+import re
+import time
+import threading
+import logging.config
+from collections import OrderedDict
+
+from src.infer_topics import TopicInferencer
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+# saved model artifacts, 'lda_cov_model_<date>' and its '_v<N>' updates
+MODEL_PATTERN = re.compile(r'^lda_cov_model_(\d{4}-\d{2}-\d{2})(?:_v(\d+))?\.expElogbeta\.npy$')
+
+class ModelNotFoundError(KeyError):
+    """No model is saved for the requested window date."""
+
+class ModelRegistry:
+    """Topic inferencers of the saved models of each window date, for the web app.
+
+    Models are discovered in model_dir and the latest version of each date is served. Their expElogbeta is
+    loaded with np.load(mmap_mode='r'), so the pages are shared by the worker processes through the page cache
+    rather than copied into each of them. At most max_models are held, the least recently used being dropped.
+    """
+
+    def __init__(self, model_dir='models', max_models=4, mmap_mode='r', **inferencer_kwargs):
+        """
+        Args:
+            model_dir: str - folder of the saved models.
+            max_models: int - number of models kept loaded.
+            mmap_mode: str - mmap_mode of np.load for expElogbeta, None loads it in memory.
+            inferencer_kwargs: other arguments of TopicInferencer.
+        """
+        self.model_dir = model_dir
+        self.max_models = max_models
+        self.mmap_mode = mmap_mode
+        self.inferencer_kwargs = inferencer_kwargs
+
+        self._paths = {}
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'load_seconds': 0.0}
+
+        self.discover()
+
+    def discover(self):
+        """Find the latest version of the model of each date in model_dir.
+
+        Returns:
+            paths: dict - model path of each date.
+        """
+        versions = {}
+
+        for file_name in os.listdir(self.model_dir) if os.path.isdir(self.model_dir) else []:
+            match = MODEL_PATTERN.match(file_name)
+            if match:
+                date, version = match.group(1), int(match.group(2) or 1)
+                if version >= versions.get(date, (0, None))[0]:
+                    versions[date] = (version, os.path.join(self.model_dir, file_name[:-len('.expElogbeta.npy')]))
+
+        with self._lock:
+            self._paths = {date: path for date, (_, path) in sorted(versions.items())}
+
+        logger.debug("%s models found in %s.", len(self._paths), self.model_dir)
+
+        return dict(self._paths)
+
+    def dates(self):
+        """Window dates with a saved model, in order."""
+
+        return list(self._paths)
+
+    def get(self, date):
+        """Inferencer of the model of a window date.
+
+        Args:
+            date: str - window date, e.g. '2020-01-15'.
+
+        Returns:
+            inferencer: TopicInferencer - inferencer of the latest model of the date.
+
+        Raises:
+            ModelNotFoundError: no model of the date is saved in model_dir.
+        """
+        # models saved since the last discovery
+        if date not in self._paths:
+            self.discover()
+        if date not in self._paths:
+            raise ModelNotFoundError("No model for %s in %s" % (date, self.model_dir))
+
+        path = self._paths[date]
+
+        with self._lock:
+            if path in self._models:
+                self._models.move_to_end(path)
+                self._stats['hits'] += 1
+                return self._models[path]
+            self._stats['misses'] += 1
+
+        start = time.perf_counter()
+        inferencer = TopicInferencer.load(path, mmap_mode=self.mmap_mode, **self.inferencer_kwargs)
+        seconds = time.perf_counter() - start
+
+        logger.info("Model %s loaded in %.3f seconds.", path, seconds)
+
+        with self._lock:
+            self._stats['load_seconds'] += seconds
+            self._models[path] = inferencer
+            self._models.move_to_end(path)
+            while len(self._models) > self.max_models:
+                evicted, _ = self._models.popitem(last=False)
+                self._stats['evictions'] += 1
+                logger.debug("Model %s dropped from the registry.", evicted)
+
+        return inferencer
+
+    def stats(self):
+        """Cache statistics of the registry.
+
+        Returns:
+            stats: dict - hits, misses, evictions, total and mean load seconds, and the loaded models.
+        """
+        with self._lock:
+            stats = dict(self._stats, loaded=list(self._models))
+
+        stats['mean_load_seconds'] = stats['load_seconds'] / stats['misses'] if stats['misses'] else 0.0
+
+        return stats
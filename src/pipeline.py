@@ -0,0 +1,295 @@
+import os
+import glob
+import string
+import logging.config
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import load_tweet_data, sample_tweet_data, remove_duplicates, format_dates, DateIndexedTweets, timeframe, clean_texts, CompactDocs, get_stop_words, create_dictionary
+from src.train_lda import train_lda, update_lda, count_topic_constructs, restore_window_artifacts
+from src.viz_topics import create_word_clouds
+from src.add_topics_db import get_engine, pool_stats, write_topics, write_topic_summary
+from src.checkpoint import StageCache, file_fingerprint
+from src.dedup import StreamingDeduplicator
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+def get_windows(time_frame):
+    """List the start dates of the time frames to analyze.
+
+    Args:
+        time_frame: dict or list - process_data.time_frame from model-meta.yaml, one of
+            a list of dates, e.g. ['2020-01-15', '2020-03-01'],
+            a mapping of names to dates, e.g. {time_frame1: '2020-01-15', time_frame2: '2020-03-01'},
+            a rolling range, e.g. {start: '2020-01-15', end: '2020-12-31', stride_days: 1}.
+
+    Returns:
+        windows: list - start dates in the format "2020-01-01".
+    """
+
+    if isinstance(time_frame, dict) and 'start' in time_frame:
+        dates = pd.date_range(time_frame['start'], time_frame['end'], freq=timedelta(days=time_frame.get('stride_days', 1)))
+        return [date.strftime('%Y-%m-%d') for date in dates]
+
+    dates = time_frame.values() if isinstance(time_frame, dict) else time_frame
+
+    return [pd.to_datetime(date).strftime('%Y-%m-%d') for date in dates]
+
+def get_lda_backend(model_config):
+    """Select the lda training backend of a tune_model or train_model section of model-meta.yaml.
+
+    Args:
+        model_config: dict - tune_model or train_model section, with a method and optional lda_params.
+
+    Returns:
+        backend: dict - keyword arguments of fit_lda.
+    """
+
+    return dict(model_config.get('lda_params') or {}, method = model_config.get('method', 'LdaModel'))
+
+def get_stage_cache(config):
+    """Create the checkpoint cache described by the checkpoint section of model-meta.yaml.
+
+    Args:
+        config: dict - parsed model-meta.yaml.
+
+    Returns:
+        cache: StageCache - checkpoint cache, disabled when the section is missing or checkpoint.enabled is false.
+    """
+
+    checkpoint_config = config.get('checkpoint') or {}
+
+    return StageCache(checkpoint_config.get('dir', 'data/checkpoints'), max_bytes = checkpoint_config.get('max_bytes'),
+                      enabled = checkpoint_config.get('enabled', False))
+
+def _load_tweets(config):
+    """Deduplicate, sample and date the tweets."""
+
+    dedup_config = config['process_data'].get('dedup') or {}
+    dedup = None
+    if dedup_config.get('method'):
+        if dedup_config['method'] not in ('exact', 'near'):
+            raise ValueError("dedup method must be 'exact', 'near' or null, got %r" % dedup_config['method'])
+        dedup = StreamingDeduplicator(near_duplicates = dedup_config['method'] == 'near', threshold = dedup_config['threshold'],
+                                      num_perm = dedup_config['num_perm'])
+
+    sample_config = config['process_data']['sample_data']
+    tweet_data = sample_tweet_data(data_path = config['load_data']['data']['path'], columns = config['acquire']['column_names'],
+                                   method = sample_config['method'], test_size = sample_config['test_size'], sample_size = sample_config['sample_size'],
+                                   stratify_by = sample_config['stratify_by'], random_state = sample_config['random_state'],
+                                   chunksize = config['load_data']['chunksize'], cache_path = config['load_data']['cache_path'],
+                                   parse_dates = config['load_data']['parse_dates'], row_filter = dedup)
+
+    if dedup is not None:
+        dedup.report()
+
+    tweet_data = remove_duplicates(tweet_data)
+
+    return format_dates(tweet_data)
+
+def _clean_tweets(tweet_data, config):
+    """Clean the text of every tweet into a CompactDocs."""
+
+    doc_clean = clean_texts(tweet_data['read_text_clean2'], get_stop_words(), set(string.punctuation), WordNetLemmatizer(),
+                            processes = config['process_data']['clean_text']['processes'],
+                            tokenizer = config['process_data']['clean_text']['tokenizer'])
+
+    return CompactDocs.from_texts(doc_clean)
+
+def prepare_tweets(config, cache = None):
+    """Load, sample, deduplicate, date and clean the tweets shared by every time frame.
+
+    Args:
+        config: dict - parsed model-meta.yaml.
+        cache: StageCache - checkpoints of the loaded and cleaned tweets, None computes them.
+
+    Returns:
+        tweet_store: DateIndexedTweets - formatted tweets with a 'doc_id' column locating their cleaned tokens in tweet_store.docs.
+        clean_key: str - checkpoint key of the cleaned tweets, passed on to run_windows.
+    """
+
+    if cache is None:
+        cache = StageCache(None, enabled = False)
+
+    data_path = config['load_data']['data']['path']
+    tweets_key = cache.key(file_fingerprint(data_path), config['acquire']['column_names'], config['load_data'],
+                           config['process_data']['sample_data'], config['process_data'].get('dedup'))
+    tweet_data = cache.get_or_compute('tweets', tweets_key, lambda: _load_tweets(config))
+
+    logger.debug("Clean the text of all sampled tweets once, time frames reuse the cleaned tokens.")
+
+    # the stored format is part of the key so checkpoints of lists of tokens are not reused
+    clean_key = cache.key(tweets_key, config['process_data']['clean_text'], 'CompactDocs')
+    docs = cache.get_or_compute('doc_clean', clean_key, lambda: _clean_tweets(tweet_data, config))
+    tweet_data['doc_id'] = np.arange(len(tweet_data))
+
+    logger.info("%s cleaned tweets stored in %.1f MB.", len(docs), docs.nbytes / 1e6)
+
+    return DateIndexedTweets(tweet_data, docs = docs), clean_key
+
+def update_window(model_path, data_path, config):
+    """Fold a csv of new tweets into the saved model of a time frame, saving the result as a new version.
+
+    Args:
+        model_path: str - path of the saved model, e.g. 'models/lda_cov_model_2020-01-15'.
+        data_path: str - csv of the new tweets, with the columns of acquire.column_names.
+        config: dict - parsed model-meta.yaml.
+
+    Returns:
+        output_path: str - path of the updated model.
+    """
+
+    tweet_data = remove_duplicates(load_tweet_data(data_path, columns = config['acquire']['column_names'],
+                                                   chunksize = config['load_data']['chunksize']))
+
+    logger.info("Update %s with %s new tweets.", model_path, len(tweet_data))
+
+    _, output_path = update_lda(model_path, _clean_tweets(tweet_data, config))
+
+    return output_path
+
+def rebuild_topic_summary(engine_string, config, results_dir = 'data/results'):
+    """Fill the topic_summary table from the topic matrices saved by earlier runs, e.g. to backfill it.
+
+    Args:
+        engine_string: str - engine string of the database.
+        config: dict - parsed model-meta.yaml.
+        results_dir: str - folder of the '<date>_topic_matrix.csv' files written by get_doc_topic_matrix.
+
+    Returns:
+        rows: dict - number of rows written for each time frame.
+    """
+
+    engine = get_engine(engine_string, **config['database']['pool'])
+    rows = {}
+
+    for path in sorted(glob.glob(os.path.join(results_dir, '*_topic_matrix.csv'))):
+        input_date = os.path.basename(path)[:-len('_topic_matrix.csv')]
+        rows[input_date] = write_topic_summary(engine, pd.read_csv(path), input_date)
+
+    logger.info("Topic summary rebuilt for %s time frames.", len(rows))
+
+    return rows
+
+def run_window(tweet_data_subset, input_date, config, engine_string, cache = None, clean_key = None, doc_clean = None):
+    """Train, visualize and store the topics of a single time frame.
+
+    The dictionary, bag of words corpus and trained model are checkpointed when a cache and the clean_key of
+    prepare_tweets are given. A checkpointed model is saved to models/ again only when its files are missing,
+    as are its k plot and results csvs.
+
+    Args:
+        tweet_data_subset: dataframe - tweets of the time frame.
+        input_date: str - first day of the time frame.
+        config: dict - parsed model-meta.yaml.
+        engine_string: str - engine string of the database receiving the top tweets.
+        cache: StageCache - checkpoints of the window stages, None computes them.
+        clean_key: str - checkpoint key of the cleaned tweets returned by prepare_tweets.
+        doc_clean: CompactDocs - cleaned tokens of the tweets, None reads them from a 'doc_clean' column of tweet_data_subset.
+
+    Returns:
+        summary: dict - input_date, number of tweets, optimal k and coherence score of the time frame.
+    """
+
+    logger.info("Running analysis of %s with %s tweets.", input_date, len(tweet_data_subset))
+
+    if cache is None or clean_key is None:
+        cache = StageCache(None, enabled = False)
+
+    if doc_clean is None:
+        doc_clean = list(tweet_data_subset['doc_clean'])
+
+    corpus_config = config['process_data'].get('corpus') or {}
+    vocabulary = config['process_data'].get('vocabulary') or {}
+    corpus_key = cache.key(clean_key, input_date, config['process_data']['window_days'], corpus_config, vocabulary)
+    corpus_path = os.path.join(corpus_config['dir'], '%s_%s.mm' % (input_date, corpus_key)) if corpus_config.get('streaming') else None
+    dictionary, doc_term_matrix = cache.get_or_compute('corpus', corpus_key, lambda: create_dictionary(doc_clean, corpus_path = corpus_path, **vocabulary))
+
+    # checkpoints of the model stage hold the scores of k, to plot them again
+    model_key = cache.key(corpus_key, config['tune_model'], config['train_model'], 'lda_results')
+    max_k, cov_model, coherence_score, doc_topic_df, top_tweets, input_date, lda_results = cache.get_or_compute('model', model_key, lambda: train_lda(doc_clean, doc_term_matrix, dictionary, top_k = config['tune_model']['k_topics'], input_date = input_date, tweet_df = tweet_data_subset, random_state = config['tune_model']['random_state'], coherence_score_method = config['tune_model']['coherence_score_method'], workers = config['tune_model']['workers'], search = config['tune_model'].get('search'), tune_backend = get_lda_backend(config['tune_model']), train_backend = get_lda_backend(config['train_model'])))
+
+    # a checkpointed model skipped train_lda, whose files may have been removed since
+    restore_window_artifacts(cov_model, doc_topic_df, top_tweets, input_date, lda_results)
+
+    ## visualize model
+    create_word_clouds(cov_model, input_date)
+
+    logger.debug("Connect to engine string.")
+    engine = get_engine(engine_string, **config['database']['pool'])
+
+    logger.info("Save top_tweets table to the database.")
+    write_topics(engine, top_tweets, input_date)
+
+    logger.info("Save the topic summary of the time frame to the database.")
+    write_topic_summary(engine, count_topic_constructs(doc_topic_df), input_date)
+    logger.debug("Connection pool: %s", pool_stats())
+
+    return {'input_date': input_date, 'tweets': len(tweet_data_subset), 'max_k': max_k, 'coherence_score': coherence_score}
+
+def _run_window_isolated(tweet_data_subset, input_date, config, engine_string, cache, clean_key, doc_clean):
+    """Run a time frame, returning its error instead of raising so other time frames carry on."""
+
+    try:
+        return run_window(tweet_data_subset, input_date, config, engine_string, cache = cache, clean_key = clean_key, doc_clean = doc_clean)
+    except Exception:
+        logger.exception("Analysis of %s failed.", input_date)
+        return {'input_date': input_date, 'tweets': len(tweet_data_subset), 'error': traceback.format_exc()}
+
+def run_windows(tweet_store, windows, config, engine_string, workers = 1, cache = None, clean_key = None):
+    """Run the analysis of several time frames, up to `workers` of them at once.
+
+    A failing time frame is logged and reported in the results without stopping the others.
+
+    Args:
+        tweet_store: DateIndexedTweets - output of prepare_tweets.
+        windows: list - start dates of the time frames, see get_windows.
+        config: dict - parsed model-meta.yaml.
+        engine_string: str - engine string of the database receiving the top tweets.
+        workers: int - number of time frames run concurrently in separate processes, 1 runs them in this process.
+        cache: StageCache - checkpoints of the window stages, None computes them.
+        clean_key: str - checkpoint key of the cleaned tweets returned by prepare_tweets.
+
+    Returns:
+        results: dataframe - one row per time frame with its summary, or its error.
+    """
+
+    days = config['process_data']['window_days']
+    subsets = [timeframe(tweet_store, input_date = input_date, days = days) for input_date in windows]
+
+    # only the tokens of each time frame are sent to the process running it
+    docs = getattr(tweet_store, 'docs', None)
+    doc_cleans = [None if docs is None else docs.take(subset['doc_id'].to_numpy()) for subset, _ in subsets]
+
+    if workers > 1 and len(windows) > 1:
+        logger.info("Running %s time frames with %s worker processes.", len(windows), workers)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_run_window_isolated, subset, input_date, config, engine_string, cache, clean_key, doc_clean)
+                       for (subset, input_date), doc_clean in zip(subsets, doc_cleans)]
+
+            results = []
+            for future, (subset, input_date) in zip(futures, subsets):
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # the worker process itself died, e.g. out of memory
+                    logger.exception("Analysis of %s failed.", input_date)
+                    results.append({'input_date': input_date, 'tweets': len(subset), 'error': traceback.format_exc()})
+    else:
+        results = [_run_window_isolated(subset, input_date, config, engine_string, cache, clean_key, doc_clean)
+                   for (subset, input_date), doc_clean in zip(subsets, doc_cleans)]
+
+    results = pd.DataFrame(results)
+
+    n_failed = results['error'].notna().sum() if 'error' in results.columns else 0
+    logger.info("%s of %s time frames completed.", len(results) - n_failed, len(results))
+
+    return results
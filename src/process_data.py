@@ -1,9 +1,15 @@
+import os
+import re
+import sys
 import string
+import itertools
+import multiprocessing
 from datetime import datetime, timedelta
 
 import logging.config
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem.wordnet import WordNetLemmatizer
@@ -13,6 +19,12 @@ from gensim.test.utils import common_corpus, common_dictionary
 from gensim.models.ldamodel import LdaModel
 from gensim.models.coherencemodel import CoherenceModel
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
 import logging.config
 
 nltk.download('punkt')
@@ -22,20 +34,150 @@ nltk.download('wordnet')
 logger = logging.getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# compact dtypes for the columns of constructs.csv, any other column is read as a string
+TWEET_DTYPES = {'predicted': 'int8',
+                'created_at': 'str',
+                'read_user_id': 'int64',
+                'read_tweet_id': 'int64',
+                'user_location': 'category',
+                'coordinates': 'str',
+                'place': 'category',
+                'read_text_clean2': 'str',
+                'Perceived_susceptibility': 'int8',
+                'Perceived_severity': 'int8',
+                'Perceived_benefits': 'int8',
+                'Perceived_barriers': 'int8'}
+
+def _tweet_dtypes(columns):
+    """Return the TWEET_DTYPES of the given columns."""
+    
+    return {col: TWEET_DTYPES.get(col, 'str') for col in columns}
+
+def _restore_categories(df, dtypes):
+    """Cast the category columns of df, which are lost when chunks are concatenated or read from the cache."""
+    
+    for col, dtype in dtypes.items():
+        if dtype == 'category':
+            df[col] = df[col].astype('object').astype('category')
+    
+    return df
+
+def _cache_schema(dtypes):
+    """Build the parquet schema of the columnar cache, categories are stored as plain strings."""
+    
+    arrow_types = {'int8': pa.int8(), 'int64': pa.int64(), 'datetime64[ns]': pa.timestamp('ns')}
+    
+    return pa.schema([(col, arrow_types.get(dtype, pa.string())) for col, dtype in dtypes.items()])
+
+def _cache_is_fresh(data_path, cache_path, columns):
+    """Check that the cache exists, is newer than the csv and holds all requested columns."""
+    
+    if not os.path.exists(cache_path):
+        return False
+    
+    if os.path.exists(data_path) and os.path.getmtime(cache_path) < os.path.getmtime(data_path):
+        logger.info("Cache %s is older than %s and will be rebuilt.", cache_path, data_path)
+        return False
+    
+    missing = set(columns) - set(pq.read_schema(cache_path).names)
+    if missing:
+        logger.info("Cache %s is missing columns %s and will be rebuilt.", cache_path, sorted(missing))
+        return False
+    
+    return True
+
+def iter_tweet_chunks(data_path, columns, chunksize=None, cache_path=None, parse_dates=False):
+    """Stream the tweet data in chunks, reading only the requested columns with compact dtypes.
+    
+    On the first read from the csv each chunk is also written to a parquet cache at cache_path. 
+    Later reads stream from the cache and skip csv parsing entirely.
+    
+    Args:
+        data_path: str - path of the csv file.
+        columns: list - columns to read.
+        chunksize: int - number of rows per chunk, None yields the whole file as one chunk.
+        cache_path: str - path of the parquet cache, None disables the cache.
+        parse_dates: bool - add the 'date' column of format_dates, stored in the cache so reruns skip parsing.
+    
+    Yields:
+        chunk: dataframe - chunk of the tweet data.
+    """
+    
+    dtypes = _tweet_dtypes(columns)
+    output_columns = list(columns)
+    
+    if parse_dates:
+        if 'created_at' not in columns:
+            raise ValueError("parse_dates requires the 'created_at' column.")
+        output_columns.append('date')
+    
+    if cache_path is not None and pq is None:
+        logger.warning("pyarrow is not installed, the columnar cache is disabled.")
+        cache_path = None
+    
+    if cache_path is not None and _cache_is_fresh(data_path, cache_path, output_columns):
+        logger.debug("Load data from cache %s.", cache_path)
+        
+        if chunksize is None:
+            yield _restore_categories(pd.read_parquet(cache_path, columns=output_columns), dtypes)
+        else:
+            for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=chunksize, columns=output_columns):
+                yield _restore_categories(batch.to_pandas(), dtypes)
+        return
+    
+    logger.debug("Load data from path.")
+    
+    reader = pd.read_csv(data_path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    chunks = [reader] if chunksize is None else reader
+    chunks = (chunk[columns] for chunk in chunks)
+    
+    if parse_dates:
+        chunks = (chunk.assign(date=parse_created_at(chunk['created_at'])) for chunk in chunks)
+    
+    if cache_path is None:
+        yield from chunks
+        return
+    
+    # write to a temporary file so that an interrupted read never leaves a partial cache behind
+    schema = _cache_schema(dict(dtypes, date='datetime64[ns]') if parse_dates else dtypes)
+    tmp_path = cache_path + '.tmp'
+    
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk.astype({col: 'object' for col, dtype in dtypes.items() if dtype == 'category'}),
+                                                    schema=schema, preserve_index=False))
+            yield chunk
+    
+    os.replace(tmp_path, cache_path)
+    logger.info("Columnar cache written to %s", cache_path)
+
 # function to load data
-def load_tweet_data(data_path = '../data/external/constructs.csv'):
-    """Load data from S3 Bucket. 
+def load_tweet_data(data_path = '../data/external/constructs.csv', columns = None, chunksize = None, row_filter = None, cache_path = None,
+                    parse_dates = False):
+    """Load the tweet data from a csv file, or from its columnar cache.
 
     Args:
-        s3path_str: str - name and path of the S3 bucket.
+        data_path: str - path of the csv file.
+        columns: list - columns to read, None reads every column of TWEET_DTYPES.
+        chunksize: int - number of rows read at a time, None reads the whole file at once.
+        row_filter: function - applied to each chunk, takes and returns a dataframe.
+        cache_path: str - path of the parquet cache, None disables the cache.
+        parse_dates: bool - add the 'date' column of format_dates, cached alongside the other columns.
 
     Returns:
         tweet_data: dataframe - dataframe of all the tweets.
     """    
     
-    logger.debug("Load data from path.")
+    if columns is None:
+        columns = list(TWEET_DTYPES)
+    
+    chunks = iter_tweet_chunks(data_path, columns, chunksize=chunksize, cache_path=cache_path, parse_dates=parse_dates)
     
-    tweet_data = pd.read_csv(data_path)
+    if row_filter is not None:
+        chunks = (row_filter(chunk) for chunk in chunks)
+    
+    # categories differ between chunks, so they are restored after concatenation
+    tweet_data = _restore_categories(pd.concat(chunks, ignore_index=True), _tweet_dtypes(columns))
     
     if len(tweet_data) > 0:
         logger.info("Dataset was loaded with %s rows", len(tweet_data))
@@ -44,6 +186,84 @@ def load_tweet_data(data_path = '../data/external/constructs.csv'):
     
     return tweet_data
 
+# annotation columns of the health belief constructs
+PERCEIVED_COLUMNS = ['Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']
+
+def _strata(chunk, stratify_by):
+    """Label each row of the chunk with its stratum: the day it was created or its combination of construct annotations."""
+    
+    if stratify_by == 'date':
+        # 'Fri Mar 27 18:03:15 +0000 2020' -> 'Mar 27 2020'
+        return chunk['created_at'].str.slice(4, 10) + chunk['created_at'].str.slice(-5)
+    elif stratify_by == 'constructs':
+        return (chunk[PERCEIVED_COLUMNS].astype(np.int64) * [8, 4, 2, 1]).sum(axis=1)
+    else:
+        raise ValueError("stratify_by must be one of None, 'date' or 'constructs', got %r" % stratify_by)
+
+# function to sample data
+def sample_tweet_data(data_path, columns, method = 'bernoulli', test_size = 0.005, sample_size = None, stratify_by = None,
+                      random_state = 66826, chunksize = 100000, cache_path = None, parse_dates = False, row_filter = None):
+    """Randomly sample tweets in one streaming pass, holding only the sample in memory.
+    
+    'bernoulli' keeps each row independently with probability test_size. 'reservoir' keeps exactly sample_size rows 
+    chosen uniformly at random, or sample_size rows of each stratum when stratify_by is set.
+    
+    Args:
+        data_path: str - path of the csv file.
+        columns: list - columns to read.
+        method: str - 'bernoulli' or 'reservoir'.
+        test_size: float - fraction of rows kept by bernoulli sampling.
+        sample_size: int - number of rows (per stratum) kept by reservoir sampling.
+        stratify_by: str - None, 'date' or 'constructs' (the combination of Perceived_* flags), reservoir sampling only.
+        random_state: int - seed of the random number generator.
+        chunksize: int - number of rows read at a time.
+        cache_path: str - path of the parquet cache, None disables the cache.
+        parse_dates: bool - add the 'date' column of format_dates, cached alongside the other columns.
+        row_filter: function - applied to each chunk before sampling, takes and returns a dataframe, e.g. a StreamingDeduplicator.
+    
+    Returns:
+        tweet_data: dataframe - sampled tweets in their original order.
+    """
+    
+    if method == 'bernoulli' and stratify_by is not None:
+        raise ValueError("stratify_by is only supported with method 'reservoir'.")
+    if method == 'reservoir' and sample_size is None:
+        raise ValueError("method 'reservoir' requires a sample_size.")
+    if method not in ('bernoulli', 'reservoir'):
+        raise ValueError("method must be 'bernoulli' or 'reservoir', got %r" % method)
+    
+    logger.debug("Randomly sample rows to reduce dataframe and speed up modeling.")
+    
+    rng = np.random.default_rng(random_state)
+    sample = []
+    n_rows = 0
+    
+    for chunk in iter_tweet_chunks(data_path, columns, chunksize=chunksize, cache_path=cache_path, parse_dates=parse_dates):
+        if row_filter is not None:
+            chunk = row_filter(chunk)
+        
+        # every row draws a uniform key, rows with the smallest keys form a uniform sample
+        keys = rng.random(len(chunk))
+        chunk = chunk.assign(_row=np.arange(n_rows, n_rows + len(chunk)), _key=keys)
+        n_rows += len(chunk)
+        
+        if method == 'bernoulli':
+            sample.append(chunk[keys < test_size])
+            continue
+        
+        pool = pd.concat(sample + [chunk], ignore_index=True).sort_values('_key', kind='mergesort')
+        if stratify_by is None:
+            sample = [pool.head(sample_size)]
+        else:
+            sample = [pool.groupby(_strata(pool, stratify_by), sort=False, observed=True).head(sample_size)]
+    
+    tweet_data = pd.concat(sample, ignore_index=True).sort_values('_row')
+    tweet_data = _restore_categories(tweet_data.drop(columns=['_row', '_key']).reset_index(drop=True), _tweet_dtypes(columns))
+    
+    logger.info("Dataframe sampled with %s of %s rows", len(tweet_data), n_rows)
+    
+    return tweet_data
+
 # function to remove duplicates
 def remove_duplicates(df):
     """Remove any rows with duplicate text.
@@ -63,10 +283,29 @@ def remove_duplicates(df):
     
     return(tweet_data)
 
+# format of the twitter 'created_at' timestamp, e.g. 'Fri Mar 27 18:03:15 +0000 2020'
+CREATED_AT_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+
+def parse_created_at(created_at):
+    """Parse twitter timestamps into the (UTC) day they were created.
+    
+    Args:
+        created_at: series - 'created_at' column of the tweet data.
+    
+    Returns:
+        date: series - datetime64 column of days, NaT where the timestamp could not be parsed.
+    """
+    
+    date = pd.to_datetime(created_at, format=CREATED_AT_FORMAT, errors='coerce', utc=True)
+    
+    return date.dt.tz_localize(None).dt.normalize().astype('datetime64[ns]')
+
 # function to format dates
 def format_dates(df):
     """Format the 'create_at' data column to contain the month, day, and year only.
     
+    The date column is kept when it was already parsed by load_tweet_data(parse_dates=True).
+    
     Args: 
         df: dataframe - dataframe of the tweet_data.
         
@@ -74,36 +313,80 @@ def format_dates(df):
         df: dataframe - tweet data with a revised date column.
     """
     
+    if 'date' in df.columns and is_datetime64_any_dtype(df['date']):
+        logger.debug("Date column was already parsed.")
+        return df
+    
     logger.debug("Format date column.")
     
-    df['date'] = df['created_at'].str.split(' ').str[1:3]
-    df['date'] = df['date'].str.join(' ')
-    df['date'] = df['date'].astype(str)
+    df['date'] = parse_created_at(df['created_at'])
     
-    df['date'] = pd.to_datetime(df['date'] + ' 2020', format='%b %d %Y', errors='coerce')
+    n_missing = df['date'].isna().sum()
+    if n_missing > 0:
+        logger.warning("%s created_at values could not be parsed.", n_missing)
     
     logger.info("New column created.")
     
     return df
 
+class DateIndexedTweets:
+    """Formatted tweets sorted by date, so that any time frame is a contiguous slice found by binary search.
+    
+    Slicing a window touches only the rows inside it, unlike a boolean mask which scans every row.
+    """
+    
+    def __init__(self, df, docs = None):
+        """
+        Args:
+            df: dataframe - tweet data with the date column of format_dates.
+            docs: CompactDocs - cleaned tokens of the tweets, the tweet with doc_id i having the tokens docs[i].
+        """
+        self.docs = docs
+        # a stable sort keeps the original order of tweets within a day, rows without a date go last
+        self.df = df.sort_values('date', kind='mergesort', na_position='last').reset_index(drop=True)
+        self.dates = self.df['date'].to_numpy(dtype='datetime64[ns]')
+    
+    def __len__(self):
+        return len(self.df)
+    
+    def window(self, start, days = 15):
+        """Return the tweets created in [start, start + days).
+        
+        Args:
+            start: str - first day of the window, e.g. "2020-01-01".
+            days: int - length of the window in days.
+        
+        Returns:
+            df: dataframe - tweets of the window.
+        """
+        start = np.datetime64(pd.to_datetime(start), 'ns')
+        end = start + np.timedelta64(days, 'D')
+        
+        lo, hi = np.searchsorted(self.dates, [start, end], side='left')
+        
+        return self.df.iloc[lo:hi]
+
 # function to select timeframe of interest (+ 15 days)
-def timeframe(df, input_date = '2020-01-01'):
-    """Subset starting at the input_date + the next 30 days
+def timeframe(df, input_date = '2020-01-01', days = 15):
+    """Subset starting at the input_date + the next 15 days
     
     Args:
-        df: dataframe - dataframe of the tweet_data.
+        df: dataframe or DateIndexedTweets - dataframe of the tweet_data, a DateIndexedTweets is sliced without a full scan.
         input_date: str - string of the date to subset in the format "2020-01-01".
+        days: int - number of days in the time frame.
     
     Returns: 
         df: dataframe - subset of the dataframe based on the input_date.
         input_date: str - date used to subset. This will be used as a file name for saved outputs.
     """
     
-    usr_input = pd.to_datetime(input_date)
+    logger.debug("Subset dataframe by the input_date + %s days.", days)
     
-    logger.debug("Subset dataframe by the input_date + 15 days.")
-
-    df = df[(df['date'] >= usr_input) & (df['date'] < (usr_input + timedelta(days=15)))]
+    if isinstance(df, DateIndexedTweets):
+        df = df.window(input_date, days=days)
+    else:
+        usr_input = pd.to_datetime(input_date)
+        df = df[(df['date'] >= usr_input) & (df['date'] < (usr_input + timedelta(days=days)))]
 
     logger.info("Dataframe has been subset.")
     
@@ -136,28 +419,389 @@ def clean_text(tweets, stop_words_list, exclude, lemma):
     
     return doc_clean
 
+# function to create stop words
+def get_stop_words():
+    """Create the list of stop words removed from tweets: single letters and the numbers 0 to 9998.
+    
+    Returns:
+        stop_words_list: list - list of words to remove from the analysis.
+    """
+    
+    alphabet_remove = list(string.ascii_lowercase)
+    number_remove = list(map(str, range(0, 9999)))
+    
+    return number_remove + alphabet_remove
+
+# approximates the token boundaries of word_tokenize for normalized, single-sentence tweets
+_TOKEN_PATTERN = re.compile(r"""
+    \w+(?=n't\b)                 # 'do' of don't, 'ca' of can't
+  | n't\b                        # n't of don't
+  | '(?:s|re|ve|ll|d|m)\b        # clitics: 's 're 've 'll 'd 'm
+  | \d+(?:[.,]\d+)+              # numbers with separators: 1,000 3.5
+  | \w+(?:(?:[-./]|'(?!(?:s|re|ve|ll|d|m)\b))\w+)*   # words, hyphenated words and abbreviations
+  | \.\.\.                        # ellipsis
+  | [^\w\s]                      # any other single punctuation character
+""", re.VERBOSE | re.IGNORECASE)
+
+# tokenizer backends of tokenize_texts
+TOKENIZERS = ('punkt', 'regex')
+
+def tokenize_texts(tweets, tokenizer = 'punkt'):
+    """Split each tweet into tokens.
+    
+    'punkt' runs nltk's word_tokenize on every tweet. 'regex' runs one precompiled regular expression over the 
+    whole column at once, which is much faster but only approximates punkt (see benchmarks/bench_tokenizers.py).
+    
+    Args:
+        tweets: iterable - tweets to tokenize.
+        tokenizer: str - 'punkt' or 'regex'.
+    
+    Returns:
+        tokens: list - list of the tokens of each tweet.
+    """
+    
+    if tokenizer == 'punkt':
+        return [word_tokenize(tweet) for tweet in tweets]
+    elif tokenizer == 'regex':
+        return pd.Series(tweets, dtype=object).str.findall(_TOKEN_PATTERN).tolist()
+    else:
+        raise ValueError("tokenizer must be one of %s, got %r" % (TOKENIZERS, tokenizer))
+
+# stop words, punctuation table, lemmatizer and lemma cache of a clean_texts worker process
+_clean_data = {}
+
+def _init_clean_worker(stop_words, punctuation_table, lemma, tokenizer):
+    """Store the cleaning inputs once per process, the lemma cache is kept across batches."""
+    
+    _clean_data['tokenizer'] = tokenizer
+    _clean_data['stop_words'] = stop_words
+    _clean_data['punctuation_table'] = punctuation_table
+    _clean_data['lemma'] = lemma
+    _clean_data['lemmas'] = {}
+
+def _clean_batch(tweets):
+    """Clean a batch of tweets with the inputs stored by _init_clean_worker, see clean_texts."""
+    
+    stop_words = _clean_data['stop_words']
+    punctuation_table = _clean_data['punctuation_table']
+    lemma = _clean_data['lemma']
+    lemmas = _clean_data['lemmas']
+    
+    doc_clean = []
+    for tokens in tokenize_texts(tweets, _clean_data['tokenizer']):
+        stop_free = " ".join([i for i in tokens if i not in stop_words])
+        
+        doc = []
+        for word in stop_free.translate(punctuation_table).split():
+            if word not in lemmas:
+                lemmas[word] = lemma.lemmatize(word).split()
+            doc.extend(lemmas[word])
+        doc_clean.append(doc)
+    
+    return doc_clean
+
+# function to clean a batch of text 
+def clean_texts(tweets, stop_words_list, exclude, lemma, processes = 1, batch_size = 10000, tokenizer = 'punkt'):
+    """Clean a column of tweets, giving the same tokens as clean_text(tweet, ...).split() for every tweet
+    when the 'punkt' tokenizer is used.
+    
+    Stop words are looked up in a set, punctuation is removed with a translation table and each distinct word
+    is lemmatized only once.
+    
+    Args:
+        tweets: iterable - tweets to clean, e.g. the read_text_clean2 column.
+        stop_words_list: list - list of words to remove from the analysis.
+        exclude: set - set of non-alphanumeric characters to remove.
+        lemma: nltk method to lemmatize text.
+        processes: int - number of processes cleaning batches in parallel, 1 cleans in this process.
+        batch_size: int - number of tweets sent to a process at a time.
+        tokenizer: str - tokenizer backend of tokenize_texts, 'punkt' or 'regex'.
+    
+    Returns:
+        doc_clean: list - list of the cleaned tokens of each tweet.
+    """
+    
+    logger.debug("Begin text processing.")
+    
+    # clean_text only ever removes single characters
+    punctuation_table = str.maketrans({ch: None for ch in exclude if len(ch) == 1})
+    initargs = (frozenset(stop_words_list), punctuation_table, lemma, tokenizer)
+    
+    tweets = list(tweets)
+    batches = [tweets[i:i + batch_size] for i in range(0, len(tweets), batch_size)]
+    
+    if processes > 1 and len(batches) > 1:
+        logger.info("Cleaning %s tweets with %s processes.", len(tweets), processes)
+        
+        # each process receives the cleaning inputs once, through the Pool initializer
+        with multiprocessing.Pool(processes, initializer=_init_clean_worker, initargs=initargs) as pool:
+            cleaned_batches = pool.map(_clean_batch, batches)
+    else:
+        _init_clean_worker(*initargs)
+        cleaned_batches = [_clean_batch(batch) for batch in batches]
+    
+    doc_clean = [doc for batch in cleaned_batches for doc in batch]
+    
+    logger.info("%s tweets cleaned.", len(doc_clean))
+    
+    return doc_clean
+
+class CompactDocs:
+    """Cleaned documents stored as one flat int32 array of token ids and an array of document offsets.
+    
+    Tokens of document i are vocab[token_ids[offsets[i]:offsets[i + 1]]]. Each distinct word is stored once, so
+    a token costs 4 bytes instead of a pointer in a python list. Iterating yields the tokens of each document as
+    a list of str, as expected by gensim's CoherenceModel texts, one document at a time.
+    """
+    
+    def __init__(self, token_ids, offsets, vocab):
+        """
+        Args:
+            token_ids: np.ndarray - int32 index in vocab of every token, document after document.
+            offsets: np.ndarray - int64 start of each document in token_ids, followed by len(token_ids).
+            vocab: np.ndarray - object array of the distinct words.
+        """
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.vocab = vocab
+    
+    @classmethod
+    def from_texts(cls, texts, block_size=10000):
+        """Build the store from lists of tokens, such as the output of clean_texts.
+        
+        Documents are encoded a block at a time, so only the tokens of one block are held as a python list
+        besides the input. Words are numbered in order of first occurrence.
+        
+        Args:
+            texts: iterable - list of tokens of each document.
+            block_size: int - number of documents encoded at once.
+        
+        Returns:
+            docs: CompactDocs - documents in the same order.
+        """
+        word_ids = {}
+        token_blocks = []
+        length_blocks = []
+        
+        texts = iter(texts)
+        while True:
+            block = list(itertools.islice(texts, block_size))
+            if not block:
+                break
+            
+            codes, words = pd.factorize(np.asarray([token for text in block for token in text], dtype=object))
+            block_ids = np.fromiter((word_ids.setdefault(word, len(word_ids)) for word in words), dtype=np.int32, count=len(words))
+            
+            token_blocks.append(block_ids[codes])
+            length_blocks.append(np.fromiter((len(text) for text in block), dtype=np.int64, count=len(block)))
+        
+        lengths = np.concatenate(length_blocks) if length_blocks else np.empty(0, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        
+        token_ids = np.concatenate(token_blocks) if token_blocks else np.empty(0, dtype=np.int32)
+        vocab = np.empty(len(word_ids), dtype=object)
+        vocab[:] = list(word_ids)
+        
+        return cls(token_ids, offsets, vocab)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        return self.vocab[self.token_ids[self.offsets[i]:self.offsets[i + 1]]].tolist()
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    @property
+    def nbytes(self):
+        """Memory used by the arrays and the distinct words."""
+        return self.token_ids.nbytes + self.offsets.nbytes + self.vocab.nbytes + sum(sys.getsizeof(word) for word in self.vocab)
+    
+    def _doc_index(self):
+        """Document of every token."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+    
+    def take(self, indices):
+        """Select documents by position, sharing the vocabulary.
+        
+        Args:
+            indices: array-like - positions of the documents to keep, in the order to keep them.
+        
+        Returns:
+            docs: CompactDocs - the selected documents.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        
+        return CompactDocs(self.token_ids[positions], offsets, self.vocab)
+    
+    def to_dictionary(self):
+        """Build the gensim dictionary of the documents without iterating over their tokens in python.
+        
+        Ids, document and collection frequencies are identical to corpora.Dictionary(docs): words are numbered
+        by the first document they appear in, alphabetically within that document.
+        
+        Returns:
+            dictionary: corpora.dictionary - dictionary mapping each term to it's integer id.
+        """
+        doc_index = self._doc_index()
+        used, first_position = np.unique(self.token_ids, return_index=True)
+        words = self.vocab[used]
+        
+        word_rank = np.empty(len(used), dtype=np.int64)
+        word_rank[np.argsort(words, kind='stable')] = np.arange(len(used))
+        order = np.lexsort((word_rank, doc_index[first_position]))
+        
+        local_ids = np.full(len(self.vocab), -1, dtype=np.int64)
+        local_ids[used[order]] = np.arange(len(used))
+        ids = local_ids[self.token_ids]
+        doc_words = np.unique(doc_index * len(used) + ids) % max(len(used), 1)
+        
+        dictionary = corpora.Dictionary()
+        dictionary.token2id = dict(zip(words[order].tolist(), range(len(used))))
+        dictionary.cfs = dict(enumerate(np.bincount(ids, minlength=len(used)).tolist()))
+        dictionary.dfs = dict(enumerate(np.bincount(doc_words, minlength=len(used)).tolist()))
+        dictionary.num_docs = len(self)
+        dictionary.num_pos = len(self.token_ids)
+        dictionary.num_nnz = len(doc_words)
+        
+        return dictionary
+    
+    def to_hash_dictionary(self, buckets):
+        """Build a hashing-trick dictionary, every word sharing the id of its bucket among a fixed number of buckets.
+        
+        Each bucket is labelled with its most frequent word, which stands for the bucket in the topics, word clouds
+        and coherence scores. Only the labels are kept, so the dictionary and models stay the same size whatever
+        the vocabulary.
+        
+        Args:
+            buckets: int - number of ids.
+        
+        Returns:
+            dictionary: corpora.HashDictionary - dictionary mapping each term to it's bucket id.
+        """
+        dictionary = corpora.HashDictionary(id_range=buckets, debug=False)
+        
+        word_buckets = np.fromiter((dictionary.restricted_hash(word) for word in self.vocab.tolist()), dtype=np.int64, count=len(self.vocab))
+        word_counts = np.bincount(self.token_ids, minlength=len(self.vocab))
+        
+        # most frequent word of each bucket, the first in vocab order on ties
+        order = np.lexsort((-word_counts, word_buckets))
+        labelled, first = np.unique(word_buckets[order], return_index=True)
+        labels = self.vocab[order[first]].tolist()
+        
+        ids = word_buckets[self.token_ids]
+        doc_buckets = np.unique(self._doc_index() * buckets + ids) % buckets
+        
+        # empty buckets get a placeholder label that never occurs in a text
+        dictionary.id2token = {i: '#%s' % i for i in range(buckets)}
+        dictionary.id2token.update(zip(labelled.tolist(), labels))
+        dictionary.token2id = {label: i for i, label in dictionary.id2token.items()}
+        dictionary.dfs = dict(enumerate(np.bincount(doc_buckets, minlength=buckets).tolist()))
+        dictionary.num_docs = len(self)
+        dictionary.num_pos = len(self.token_ids)
+        dictionary.num_nnz = len(doc_buckets)
+        
+        return dictionary
+    
+    def bow(self, dictionary, block_size=10000):
+        """Bag of words of each document, identical to (dictionary.doc2bow(doc) for doc in docs).
+        
+        Yields the documents one at a time, counting their words with numpy a block of documents at a time,
+        so that MmCorpus.serialize streams the corpus without it being held in memory.
+        
+        Args:
+            dictionary: corpora.dictionary - dictionary mapping each term to it's integer id, words missing from it are dropped.
+                A HashDictionary maps every word to its bucket.
+            block_size: int - number of documents counted at once.
+        
+        Yields:
+            bow: list - (term id, count) pairs of a document, sorted by term id.
+        """
+        if isinstance(dictionary, corpora.HashDictionary):
+            word_ids = (dictionary.restricted_hash(word) for word in self.vocab.tolist())
+        else:
+            word_ids = (dictionary.token2id.get(word, -1) for word in self.vocab.tolist())
+        local_ids = np.fromiter(word_ids, dtype=np.int64, count=len(self.vocab))
+        num_terms = max(len(dictionary), 1)
+        
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            ids = local_ids[self.token_ids[self.offsets[start]:self.offsets[stop]]]
+            doc_index = np.repeat(np.arange(stop - start), np.diff(self.offsets[start:stop + 1]))
+            known = ids >= 0
+            
+            keys, counts = np.unique(doc_index[known] * num_terms + ids[known], return_counts=True)
+            bounds = np.searchsorted(keys // num_terms, np.arange(stop - start + 1))
+            terms, counts = (keys % num_terms).tolist(), counts.tolist()
+            
+            for i in range(stop - start):
+                yield list(zip(terms[bounds[i]:bounds[i + 1]], counts[bounds[i]:bounds[i + 1]]))
+
 # function to create document term matrix and dictionary corpus 
-def create_dictionary(df):
+def create_dictionary(df, corpus_path=None, no_below=1, no_above=1.0, keep_n=None, hash_buckets=None):
     """Create dictionary and a matrix of the terms per document.
     
+    With a corpus_path, the matrix is streamed to a Matrix Market file with an index instead of being kept in
+    memory, and returned as a gensim MmCorpus that reads the documents back from disk when iterated.
+    
     Args: 
-        df: dataframe - processed dataframe.
+        df: dataframe or CompactDocs - processed dataframe, a CompactDocs is counted with numpy.
+        corpus_path: str - Matrix Market file receiving the matrix, e.g. 'data/corpus/2020-01-15.mm', None keeps it in memory.
+        no_below: int - drop words appearing in fewer documents.
+        no_above: float - drop words appearing in more than this share of the documents.
+        keep_n: int - keep only this many of the most frequent remaining words, None keeps them all.
+        hash_buckets: int - map words to this many ids with the hashing trick instead of one id per word, see CompactDocs.to_hash_dictionary.
     
     Returns:
         dictionary: corpora.dictionary - dictionary mapping each term to it's integer id.
-        doc_term_matrix: list - bag of words matrix with frequency of each term mapped to dictionary id.
+        doc_term_matrix: list or MmCorpus - bag of words matrix with frequency of each term mapped to dictionary id.
     
     """
     
     logger.debug("Create dictionary.")
     
-    dictionary = corpora.Dictionary(df)
+    filtered = no_below > 1 or no_above < 1.0 or keep_n is not None
+    
+    if hash_buckets is not None:
+        if filtered:
+            raise ValueError("no_below, no_above and keep_n do not apply to a hashing dictionary.")
+        
+        docs = df if isinstance(df, CompactDocs) else CompactDocs.from_texts(df)
+        dictionary = docs.to_hash_dictionary(hash_buckets)
+        bows = docs.bow(dictionary)
+    else:
+        dictionary = df.to_dictionary() if isinstance(df, CompactDocs) else corpora.Dictionary(df)
+        
+        if filtered:
+            num_terms = len(dictionary)
+            dictionary.filter_extremes(no_below=no_below, no_above=no_above, keep_n=keep_n)
+            
+            logger.info("Vocabulary filtered from %s to %s words.", num_terms, len(dictionary))
+        
+        bows = df.bow(dictionary) if isinstance(df, CompactDocs) else (dictionary.doc2bow(doc) for doc in df)
     
     logger.info("Dictionary created.")
 
     logger.debug("Create document term matrix.")
     
-    doc_term_matrix = [dictionary.doc2bow(doc) for doc in df]
+    if corpus_path is None:
+        doc_term_matrix = list(bows)
+    else:
+        os.makedirs(os.path.dirname(corpus_path) or '.', exist_ok=True)
+        corpora.MmCorpus.serialize(corpus_path, bows, id2word=dictionary)
+        doc_term_matrix = corpora.MmCorpus(corpus_path)
+        
+        logger.debug("Document term matrix streamed to %s", corpus_path)
     
     logger.info("Document term matrix created.")
     
@@ -0,0 +1,165 @@
+import time
+import queue
+import string
+import threading
+import logging.config
+from concurrent.futures import Future
+
+import numpy as np
+from nltk.stem.wordnet import WordNetLemmatizer
+
+from src.process_data import clean_texts, get_stop_words
+from src.model_registry import ModelNotFoundError
+
+# configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel("DEBUG")
+
+class MicroBatcher:
+    """Group the items submitted by concurrent callers into batches handled by one background thread.
+
+    A batch is handled as soon as it holds max_batch_size items, or max_wait seconds after its first request
+    arrived, whichever comes first. Under light load a request waits at most max_wait, under heavy load the
+    cost of each call of handler is shared by a whole batch, which keeps latency flat as the request rate climbs.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_wait=0.005):
+        """
+        Args:
+            handler: callable - takes the list of payloads of a batch and returns the list of their results,
+                an Exception as a result is raised to the caller of that payload only.
+            max_batch_size: int - number of items, e.g. texts, above which a batch is handled without waiting.
+            max_wait: float - seconds a batch waits for more requests after its first one.
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'items': 0, 'batches': 0}
+
+    def _start(self):
+        """Start the batching thread on first use, so that it runs in the process serving requests."""
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, payload, size=1):
+        """Queue a payload for the next batch.
+
+        Args:
+            payload: object - passed to handler with the other payloads of its batch.
+            size: int - number of items of the payload counted against max_batch_size.
+
+        Returns:
+            future: Future - result of the payload.
+        """
+        self._start()
+
+        future = Future()
+        self._queue.put((payload, size, future))
+
+        return future
+
+    def _next_batch(self):
+        """Block for a first request, then collect requests until the batch is full or max_wait has passed."""
+
+        batch = [self._queue.get()]
+        size = batch[0][1]
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            size += batch[-1][1]
+
+        return batch, size
+
+    def _run(self):
+        """Handle batches forever."""
+
+        while True:
+            batch, size = self._next_batch()
+            payloads = [payload for payload, _, _ in batch]
+
+            self.stats['requests'] += len(batch)
+            self.stats['items'] += size
+            self.stats['batches'] += 1
+
+            try:
+                results = self.handler(payloads)
+            except Exception as e:
+                logger.error("Batch of %s requests failed: %s", len(batch), e)
+                results = [e] * len(batch)
+
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+class TopicScorer:
+    """Topic probabilities of tweets for the model of a window date, cleaned as in the pipeline.
+
+    Called with a batch of (date, texts) requests, cleans all their texts with one call of clean_texts and
+    runs one TopicInferencer batch per date.
+    """
+
+    def __init__(self, registry, tokenizer='punkt'):
+        """
+        Args:
+            registry: ModelRegistry - models of each window date.
+            tokenizer: str - tokenizer of clean_texts, should be process_data.clean_text.tokenizer of model-meta.yaml.
+        """
+        self.registry = registry
+        self.tokenizer = tokenizer
+        self.stop_words = get_stop_words()
+        self.exclude = set(string.punctuation)
+        self.lemma = WordNetLemmatizer()
+
+    def __call__(self, requests):
+        """
+        Args:
+            requests: list - (date, texts) of each request.
+
+        Returns:
+            results: list - for each request, a dict with the probabilities of every topic and the most likely
+                topic of each text, or the ModelNotFoundError of a date without a model.
+        """
+        # read_text_clean2, on which the models are trained, is lower case
+        texts = [text.lower() for _, request_texts in requests for text in request_texts]
+        doc_clean = clean_texts(texts, self.stop_words, self.exclude, self.lemma, tokenizer=self.tokenizer)
+
+        starts = np.cumsum([0] + [len(request_texts) for _, request_texts in requests])
+        results = [None] * len(requests)
+
+        for date in set(date for date, _ in requests):
+            indices = [i for i, (request_date, _) in enumerate(requests) if request_date == date]
+
+            try:
+                inferencer = self.registry.get(date)
+            except ModelNotFoundError as e:
+                for i in indices:
+                    results[i] = e
+                continue
+
+            probs = inferencer.topic_matrix([doc for i in indices for doc in doc_clean[starts[i]:starts[i + 1]]])
+
+            offset = 0
+            for i in indices:
+                request_probs = probs[offset:offset + starts[i + 1] - starts[i]]
+                offset += len(request_probs)
+                results[i] = {'date': date,
+                              'probabilities': request_probs.round(6).tolist(),
+                              'topic': request_probs.argmax(axis=1).tolist()}
+
+        return results
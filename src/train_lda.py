@@ -1,20 +1,214 @@
+import os
+import re
+import time
+import functools
+import itertools
+import multiprocessing
 import logging.config
+
 import numpy as np
 import pandas as pd
 
 from gensim import corpora
 from gensim.test.utils import common_corpus, common_dictionary
 from gensim.models.ldamodel import LdaModel
+from gensim.models.ldamulticore import LdaMulticore
 from gensim.models.coherencemodel import CoherenceModel
 
+from src.coherence import CoherenceEngine
+from src.infer_topics import export_inference_arrays
+
 # configure logger
 logger = logging.getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# k search strategies of topic_eval
+SEARCH_STRATEGIES = ('grid', 'coarse_to_fine', 'golden', 'halving')
+
+# lda training backends selectable with tune_model.method and train_model.method
+LDA_BACKENDS = {'LdaModel': LdaModel, 'LdaMulticore': LdaMulticore}
+
+def fit_lda(doc_term_matrix, dictionary, num_topics, random_state, method='LdaModel', workers=None, chunksize=2000, passes=1, iterations=50):
+    """Train an lda model with the selected backend.
+    
+    Both backends save models that load with LdaModel.load, LdaMulticore being a subclass of LdaModel.
+    
+    Args: 
+        doc_term_matrix: list - bag of words matrix with frequency of each term mapped to dictionary id. 
+        dictionary: corpora.dictionary - dictionary mapping each term to it's integer id.
+        num_topics: int - number of topics.
+        random_state: int - integer to set the random to.
+        method: str - backend, one of LDA_BACKENDS.
+        workers: int - worker processes of LdaMulticore, None uses the number of cores minus one. Ignored by LdaModel.
+        chunksize: int - number of documents in each training chunk.
+        passes: int - number of passes over the corpus.
+        iterations: int - maximum number of inference iterations on each chunk.
+    
+    Return: 
+        lda_model: trained lda model object.
+    """
+    
+    if method not in LDA_BACKENDS:
+        raise ValueError("Unknown lda backend %r, expected one of %s." % (method, ', '.join(LDA_BACKENDS)))
+    
+    params = {'corpus': doc_term_matrix, 'id2word': dictionary, 'num_topics': num_topics, 'random_state': random_state,
+              'chunksize': chunksize, 'passes': passes, 'iterations': iterations}
+    
+    if method == 'LdaMulticore':
+        params['workers'] = workers
+    
+    return LDA_BACKENDS[method](**params)
+
+# corpus and dictionary shared with the worker processes of a parallel topic_eval sweep
+_sweep_data = {}
+
+def _init_sweep_worker(doc_term_matrix, dictionary):
+    """Store the sweep inputs once per worker process so each task only ships its k."""
+    
+    _sweep_data['doc_term_matrix'] = doc_term_matrix
+    _sweep_data['dictionary'] = dictionary
+
+def _train_topics_worker(t, random_state, topn, backend):
+    """Train t topics in a worker process using the inputs stored by _init_sweep_worker."""
+    
+    return _train_topics(t, _sweep_data['doc_term_matrix'], _sweep_data['dictionary'], random_state, topn, backend)
+
+def _train_topics(t, doc_term_matrix, dictionary, random_state, topn, backend):
+    """Train an lda model with t topics and return the top words of each topic and the training time in seconds."""
+    
+    start = time.perf_counter()
+    cov_model = fit_lda(doc_term_matrix, dictionary, t, random_state, **backend)
+    topics = CoherenceModel.top_topics_as_word_lists(cov_model, dictionary, topn)
+    
+    return topics, time.perf_counter() - start
+
+class _KSearch:
+    """Train and score batches of k for topic_eval, recording every evaluation."""
+    
+    def __init__(self, doc_term_matrix, dictionary, random_state, coherence_score_method, coherence_engine, executor, backend):
+        self.backend = backend
+        self.doc_term_matrix = doc_term_matrix
+        self.dictionary = dictionary
+        self.random_state = random_state
+        self.coherence_score_method = coherence_score_method
+        self.coherence_engine = coherence_engine
+        self.executor = executor
+        self.results = []
+        self.scores = {}
+    
+    def evaluate(self, ks, iterations):
+        """Score the values of k not yet evaluated at this number of iterations and return the score of every k.
+        
+        Every k is trained before any is scored, so the coherence statistics of their top words are gathered in
+        at most one pass over the texts per call. Strategies pass all the k they score together, e.g. the whole
+        grid, a halving rung or a golden-section probe pair.
+        """
+        
+        new_ks = [t for t in dict.fromkeys(ks) if (t, iterations) not in self.scores]
+        topn = self.coherence_engine.topn
+        
+        backend = dict(self.backend, iterations=iterations)
+        
+        if self.executor is not None and len(new_ks) > 1:
+            train = functools.partial(_train_topics_worker, random_state=self.random_state, topn=topn, backend=backend)
+            trained = self.executor.map(train, new_ks)
+        else:
+            trained = [_train_topics(t, self.doc_term_matrix, self.dictionary, self.random_state, topn, backend) for t in new_ks]
+        
+        if new_ks:
+            self.coherence_engine.prepare([topics for topics, _ in trained], self.coherence_score_method)
+        
+        for t, (topics, seconds) in zip(new_ks, trained):
+            start = time.perf_counter()
+            score = self.coherence_engine.score(topics, self.coherence_score_method)
+            seconds += time.perf_counter() - start
+            
+            logger.debug("k=%s with %s iterations scored %s in %.2f seconds.", t, iterations, score, seconds)
+            
+            self.scores[(t, iterations)] = score
+            self.results.append((t, score, iterations, seconds))
+        
+        return {t: self.scores[(t, iterations)] for t in ks}
+
+def _sweep(search, ks, iterations, batch_size, patience, min_delta):
+    """Evaluate ks in increasing order, stopping once `patience` values of k in a row do not improve the best score by min_delta.
+    
+    Without patience every k is evaluated in one batch, gathering the coherence statistics once for the sweep.
+    """
+    
+    best = -np.inf
+    since_best = 0
+    
+    if patience is None:
+        batch_size = max(len(ks), 1)
+    
+    for i in range(0, len(ks), batch_size):
+        for t, score in search.evaluate(ks[i:i + batch_size], iterations).items():
+            if score > best + min_delta:
+                best, since_best = score, 0
+            else:
+                since_best += 1
+        
+        if patience is not None and since_best >= patience:
+            logger.info("Coherence plateaued, stopping the sweep at k=%s.", ks[min(i + batch_size, len(ks)) - 1])
+            break
+
+def _golden_section(search, k_range, iterations):
+    """Narrow k_range around the maximum coherence, assuming coherence is unimodal in k."""
+    
+    inv_phi = (np.sqrt(5) - 1) / 2
+    lo, hi = k_range[0], k_range[-1]
+    
+    while hi - lo > 2:
+        c = hi - int(round((hi - lo) * inv_phi))
+        d = lo + int(round((hi - lo) * inv_phi))
+        if c >= d:
+            c, d = d - 1, d
+        
+        scores = search.evaluate([c, d], iterations)
+        
+        if scores[c] < scores[d]:
+            lo = c
+        else:
+            hi = d
+    
+    search.evaluate(list(range(lo, hi + 1)), iterations)
+
+def _successive_halving(search, k_range, iterations, eta):
+    """Score every k with cheap short runs and only train the best 1/eta of them for longer, up to `iterations`.
+    
+    The budget of a rung is the number of E-step iterations rather than the number of passes: models are tuned
+    with a single pass (tune_model.lda_params.passes), which leaves no cheaper number of passes to start from.
+    """
+    
+    candidates = list(k_range)
+    rungs = int(np.ceil(np.log(len(candidates)) / np.log(eta))) if len(candidates) > 1 else 0
+    rung_iterations = max(1, iterations // eta ** rungs)
+    
+    while True:
+        scores = search.evaluate(candidates, rung_iterations)
+        
+        if rung_iterations >= iterations:
+            break
+        
+        keep = max(1, int(np.ceil(len(candidates) / eta)))
+        candidates = sorted(candidates, key=scores.get, reverse=True)[:keep]
+        rung_iterations = min(iterations, rung_iterations * eta)
+        
+        logger.debug("%s values of k promoted to %s iterations.", len(candidates), rung_iterations)
+
 # function to evaluate number of topics
-def topic_eval(doc_clean, doc_term_matrix, dictionary, top_k, input_date, random_state, coherence_score_method):
+def topic_eval(doc_clean, doc_term_matrix, dictionary, top_k, input_date, random_state, coherence_score_method, workers=1, coherence_engine=None,
+               strategy='grid', patience=None, min_delta=0.0, step=3, eta=3, iterations=None, backend=None):
     """Evaluate the number of topics (k) to choose via the highest coherence score.
     
+    Strategies:
+        grid: every k from 4 to top_k - 1.
+        coarse_to_fine: every step-th k, then every k around the best of them.
+        golden: golden-section search, assumes coherence rises then falls with k.
+        halving: successive halving, every k is trained with few iterations and the best 1/eta are retrained with eta times more.
+            The budget is E-step iterations, not passes, see _successive_halving.
+    
     Args: 
         doc_clean: dataframe - dataframe with processed text.
         doc_term_matrix: list - bag of words matrix with frequency of each term mapped to dictionary id. 
@@ -23,28 +217,65 @@ def topic_eval(doc_clean, doc_term_matrix, dictionary, top_k, input_date, random
         input_date: str - date that the user selected to subset the data.
         random_state: int - integer to set the random to.
         coherence: str - select coherence score from gensim methods.
+        workers: int - number of processes used to train the models of each k in parallel, 1 trains them serially.
+        coherence_engine: CoherenceEngine - engine holding the word statistics of doc_clean, one is created if None.
+        strategy: str - k search strategy, one of SEARCH_STRATEGIES.
+        patience: int - grid and coarse_to_fine stop after this many k in a row without improvement, None sweeps every k.
+        min_delta: float - smallest increase of the coherence score counted as an improvement.
+        step: int - distance between the k of the coarse_to_fine first pass.
+        eta: int - halving keeps 1/eta of the k at each rung.
+        iterations: int - iterations of a fully trained model, None uses the iterations of the backend.
+        backend: dict - keyword arguments of fit_lda selecting the training backend, None trains a default LdaModel.
     
     Return: 
-        lda_results: dataframe - of scores from the k topic evaluation
+        lda_results: dataframe - topic, score, iterations and seconds of every evaluation, in the order they were run.
     """
 
     logger.debug("Begin hyerparameter testing to determine number of k topics. to use in final model.")
     
-    results = []
-    
-    for t in range(4, top_k):
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError("Unknown k search strategy %r, expected one of %s." % (strategy, ', '.join(SEARCH_STRATEGIES)))
+    
+    if coherence_engine is None:
+        coherence_engine = CoherenceEngine(doc_clean, dictionary)
+    
+    backend = dict(backend or {})
+    if iterations is None:
+        iterations = backend.get('iterations', 50)
+    
+    k_range = range(4, top_k)
+    workers = min(workers, len(k_range))
+    
+    executor = None
+    if workers > 1:
+        logger.info("Training k with %s worker processes.", workers)
+        # the corpus and dictionary are sent to each worker once, unlike ProcessPoolExecutor a Pool has an initializer before python 3.7
+        executor = multiprocessing.Pool(workers, initializer=_init_sweep_worker, initargs=(doc_term_matrix, dictionary))
+    
+    search = _KSearch(doc_term_matrix, dictionary, random_state, coherence_score_method, coherence_engine, executor, backend)
+    
+    try:
+        if strategy == 'grid':
+            _sweep(search, list(k_range), iterations, max(workers, 1), patience, min_delta)
+        elif strategy == 'coarse_to_fine':
+            coarse_ks = sorted(set(k_range[::step]) | {k_range[-1]})
+            _sweep(search, coarse_ks, iterations, max(workers, 1), patience, min_delta)
+            best = max(search.scores, key=search.scores.get)[0]
+            search.evaluate([t for t in range(best - step + 1, best + step) if t in k_range], iterations)
+        elif strategy == 'golden':
+            _golden_section(search, k_range, iterations)
+        else:
+            _successive_halving(search, k_range, iterations, eta)
+    finally:
+        if executor is not None:
+            executor.close()
+            executor.join()
         
-        cov_model = LdaModel(corpus=doc_term_matrix, id2word=dictionary, num_topics=t, random_state=random_state)
-
-        cm = CoherenceModel(model=cov_model, dictionary=dictionary, texts=doc_clean, coherence=coherence_score_method)
-        score = cm.get_coherence()
-        tup = t, score
-        results.append(tup)
-    logger.info("Hyperparameter testing complete.")
+    logger.info("Hyperparameter testing complete, %s models trained in %.1f seconds.", len(search.results), sum(r[3] for r in search.results))
 
     logger.debug("Save topic number and coherence score as a dataframe.")
     
-    lda_results = pd.DataFrame(results, columns=['topic', 'score'])
+    lda_results = pd.DataFrame(search.results, columns=['topic', 'score', 'iterations', 'seconds'])
     
     logger.debug("Evaluate whether the last tested k had the highest coherence score. If so, next iteration may want to increase k.")
     
@@ -56,12 +287,99 @@ def get_max_k(lda_results):
     
     logger.debug("Abstract topic_num with the max coherence score.")
     
-    max_k = lda_results.iloc[lda_results['score'].argmax()][['topic']].astype(int)
+    # cheap low iteration scores of successive halving are only used to pick which k to train fully
+    if 'iterations' in lda_results.columns:
+        lda_results = lda_results[lda_results['iterations'] == lda_results['iterations'].max()]
+    
+    max_k = int(lda_results['topic'].iloc[lda_results['score'].argmax()])
     
     logger.info("Optimal number of k topics is: %s", max_k)
     
     return max_k
-     
+
+def doc_topics_to_matrix(doc_topics, num_topics, block_size=10000):
+    """Convert the sparse (topic_num, prob) output of get_document_topics into a dense matrix.
+    
+    Args: 
+        doc_topics: iterable - per-document lists of (topic_num, prob) tuples, e.g. from lda_model.get_document_topics.
+        num_topics: int - number of topics in the lda model.
+        block_size: int - number of documents converted per block.
+    
+    Return: 
+        doc_topic_probs: np.ndarray - (documents x topics) matrix of topic probabilities, 0 where a topic was dropped.
+    """
+    
+    blocks = []
+    doc_topics = iter(doc_topics)
+    
+    while True:
+        block = list(itertools.islice(doc_topics, block_size))
+        if not block:
+            break
+        
+        lengths = np.fromiter((len(doc) for doc in block), dtype=np.int64, count=len(block))
+        pairs = np.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(block)), dtype=np.float64, count=2 * lengths.sum()).reshape(-1, 2)
+        
+        block_probs = np.zeros((len(block), num_topics))
+        block_probs[np.repeat(np.arange(len(block)), lengths), pairs[:, 0].astype(np.int64)] = pairs[:, 1]
+        blocks.append(block_probs)
+    
+    if not blocks:
+        return np.zeros((0, num_topics))
+    
+    return np.vstack(blocks)
+
+# columns of the tweets carried into doc_topic_df, read_tweet_id identifies a tweet in the topics table
+DOC_TOPIC_COLUMNS = ['read_tweet_id', 'read_text_clean2', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']
+
+def _require_columns(df, columns, name):
+    """Raise a ValueError naming the columns missing from df."""
+    
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError("%s is missing the columns %s." % (name, missing))
+
+def assign_doc_topics(doc_topic_probs, tweet_df):
+    """Assign each tweet the topic with the highest probability and join its original annotations.
+    
+    Args: 
+        doc_topic_probs: np.ndarray - (documents x topics) matrix of topic probabilities, in the same row order as tweet_df.
+        tweet_df: dataframe - original dataframe of covid-19 tweets, with the DOC_TOPIC_COLUMNS.
+    
+    Return: 
+        doc_topic_df: dataframe - dataframe of tweets with the topic_num and prob of their most probable topic.
+    """
+    
+    _require_columns(tweet_df, DOC_TOPIC_COLUMNS, 'tweet_df')
+    
+    if len(doc_topic_probs) != len(tweet_df):
+        raise ValueError("doc_topic_probs has %s rows but tweet_df has %s rows." % (len(doc_topic_probs), len(tweet_df)))
+    
+    topic_num = doc_topic_probs.argmax(axis=1)
+    
+    doc_topic_df = pd.DataFrame({'topic_num': topic_num,
+                                 'prob': doc_topic_probs[np.arange(len(topic_num)), topic_num]})
+    
+    timeframe_slice = tweet_df[DOC_TOPIC_COLUMNS].reset_index(drop=True)
+    
+    return pd.concat([doc_topic_df, timeframe_slice], axis=1)
+
+def count_topic_constructs(doc_topic_df):
+    """Count the original health-belief annotations and the tweets of each topic_num.
+    
+    Args: 
+        doc_topic_df: dataframe - dataframe of the tweets mapped to their highest probable topic.
+    
+    Return: 
+        doc_topic_matrix: dataframe - counts of original annotations and tweets per topic_num.
+    """
+    
+    doc_topic_matrix = doc_topic_df.groupby(['topic_num'])[['Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']].sum().reset_index()
+    
+    doc_topic_matrix['count'] = doc_topic_matrix['topic_num'].map(doc_topic_df['topic_num'].value_counts())
+    
+    return doc_topic_matrix
+
 def get_doc_topic_matrix(lda_model, doc_term_matrix, tweet_df, input_date):
     """Caculates the topic probability of each tweet and then assigns the topic with the highest probability.
     
@@ -72,42 +390,27 @@ def get_doc_topic_matrix(lda_model, doc_term_matrix, tweet_df, input_date):
         input_date: str - date used to subset dataframe.
     
     Return: 
-        doc_topic_max_df: dataframe - dataframe containing a row for each tweet with a column 'topic_num' indicating the topic with the highest probability for that tweet.
-        doc_topic_df: dataframe - dataframe of tweets and their probabilities per topic.
+        doc_topic_matrix: dataframe - counts of original annotations and tweets per topic_num.
+        doc_topic_df: dataframe - dataframe containing a row for each tweet with a column 'topic_num' indicating the topic with the highest probability for that tweet.
         
     """
     
     logger.debug("Calculate topic probability of each tweet.")
     
     doc_topics = lda_model.get_document_topics(doc_term_matrix, minimum_probability=None, minimum_phi_value=None, per_word_topics=False)
+    doc_topic_probs = doc_topics_to_matrix(doc_topics, lda_model.num_topics)
     
     logger.info("Topic probability calculated.")
 
-    doc_topic_max = []
-
     logger.debug("For each original tweet, assign a column with the topic_num containing the max probability of being associated with that tweet.")
     
-    for d in range(len(doc_topics)):
-        topic_df = pd.DataFrame(doc_topics[d])
-        topic_df.columns = ['topic_num', 'prob']
-        topic_df = topic_df.iloc[topic_df['prob'].argmax()]
-        topic_df = pd.DataFrame(topic_df).transpose()
-        tweet_data_subset_df = tweet_df.reset_index()
-        timeframe_slice = tweet_data_subset_df[['read_text_clean2','Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']]
-        topic_df = pd.concat([topic_df, timeframe_slice.reindex(topic_df.index)], axis=1, join="inner")
-        doc_topic_max.append(topic_df)
+    doc_topic_df = assign_doc_topics(doc_topic_probs, tweet_df)
         
     logger.info("New topic probability dataframe created.")
     
-    doc_topic_max_df = pd.concat(doc_topic_max)
-    
     logger.debug("Count the number of original health-belief annotations by topic_num.")
     
-    doc_topic_df = doc_topic_max_df.copy()
-    
-    doc_topic_matrix = doc_topic_df.groupby(['topic_num'])['Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits','Perceived_barriers'].sum().reset_index()
-    
-    doc_topic_matrix['count'] = doc_topic_matrix['topic_num'].map(doc_topic_df['topic_num'].value_counts())
+    doc_topic_matrix = count_topic_constructs(doc_topic_df)
     
     logger.info("Matrix of topic_num and annotation counts generated.")
     
@@ -123,13 +426,15 @@ def create_topics_table(doc_topic_df, input_date):
     """Creates a confusion-like-matrix to count annotations of the orginal tweets per highest probable topic.
     
         Args: 
-            doc_topic_df: dataframe - dataframe of the tweets mapped to their highest probable topic.
+            doc_topic_df: dataframe - dataframe of the tweets mapped to their highest probable topic, see assign_doc_topics.
             input_date: str - input_date will be added to a new column to indicate the time period that generated the topic.
         
         Returns:
             top_tweets: dataframe - dataframe containing counts of original annotations by topic_num.
     """
     
+    _require_columns(doc_topic_df, ['topic_num', 'prob'] + DOC_TOPIC_COLUMNS, 'doc_topic_df')
+    
     logger.debug("Sort doc_topic_max_df in order of probability.")
     
     doc_topic_max_df_ordered = doc_topic_df.sort_values('prob', ascending=False)
@@ -146,8 +451,8 @@ def create_topics_table(doc_topic_df, input_date):
     
     logger.debug("Subset dataframe to keep only relevant columns.")
     
-    top_tweets = top_tweets[['date', 'topic_num', 'prob', 'read_text_clean2', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']]
-    top_tweets.columns = ['date', 'topic_num', 'prob', 'tweet', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']
+    top_tweets = top_tweets[['read_tweet_id', 'date', 'topic_num', 'prob', 'read_text_clean2', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']]
+    top_tweets.columns = ['read_tweet_id', 'date', 'topic_num', 'prob', 'tweet', 'Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']
     
     logger.info("Dataframe is subset and organized.")
     
@@ -159,7 +464,7 @@ def create_topics_table(doc_topic_df, input_date):
     
     return(top_tweets)
 
-def train_lda(doc_clean, doc_term_matrix, dictionary, top_k, input_date, tweet_df, random_state, coherence_score_method):
+def train_lda(doc_clean, doc_term_matrix, dictionary, top_k, input_date, tweet_df, random_state, coherence_score_method, workers=1, search=None, tune_backend=None, train_backend=None):
     """Train the lda model on the max K found during topic evaluation.
     
     Args: 
@@ -171,24 +476,29 @@ def train_lda(doc_clean, doc_term_matrix, dictionary, top_k, input_date, tweet_d
         tweet_df: dataframe - original dataframe of tweets.
         random_state: int - integer to set the random to.
         coherence_score_method - str - method to calculate gensim score. 
+        workers: int - number of processes used to evaluate k topics in parallel.
+        search: dict - keyword arguments of topic_eval selecting the k search strategy, e.g. {'strategy': 'golden'}.
+        tune_backend: dict - keyword arguments of fit_lda used to evaluate k, e.g. {'method': 'LdaMulticore', 'workers': 3}.
+        train_backend: dict - keyword arguments of fit_lda used to train the final model.
     
     Return: 
         max_k: int - integer indicating optimal number of k topics.
         cov_model: trained lda model object.
         coherence_score: int - return coherence score.
         doc_topic_max_df: dataframe - dataframe of each orignal tweet/annotation with the topic most associated with it.
+        top_tweets: dataframe - top tweets of each topic, see create_topics_table.
+        input_date: str - date that the user selected to subset the data.
+        lda_results: dataframe - score of each k evaluated by topic_eval.
     """
     
+    # word statistics of the texts are gathered once and shared by the k evaluation and the final score
+    coherence_engine = CoherenceEngine(doc_clean, dictionary)
+    
     # evaluate best k topics
-    lda_results = topic_eval(doc_clean, doc_term_matrix, dictionary, top_k, input_date, random_state, coherence_score_method)
+    lda_results = topic_eval(doc_clean, doc_term_matrix, dictionary, top_k, input_date, random_state, coherence_score_method, workers=workers, coherence_engine=coherence_engine, backend=tune_backend, **(search or {}))
     
     # save plots
-    s = pd.Series(lda_results.score.values, index=lda_results.topic.values)
-    
-    plt = s.plot()
-    plt = plt.get_figure()
-    plt.savefig("app/static/" + input_date + "_k_topics" + ".png")
-    plt.clf()
+    plot_k_scores(lda_results, input_date)
     
     logger.debug("Determine optimal number of k topics.")
     # get k with highest coherence score
@@ -197,18 +507,18 @@ def train_lda(doc_clean, doc_term_matrix, dictionary, top_k, input_date, tweet_d
     logger.info("%s is the optimal k", max_k)
     
     # train model with optimal k
-    cov_model = LdaModel(corpus = doc_term_matrix, id2word = dictionary, num_topics = max_k, random_state=random_state)
+    cov_model = fit_lda(doc_term_matrix, dictionary, max_k, random_state, **(train_backend or {}))
     
     # save trained model object
     logger.debug("Save trained LDA object.")
     
     cov_model.save('models/' + 'lda_cov_model' + '_' + input_date)
+    export_inference_arrays(cov_model, 'models/' + 'lda_cov_model' + '_' + input_date)
     
     logger.info("LDA object saved to 'model/' folder.")
     
     # get final coherence score
-    cm = CoherenceModel(model=cov_model, dictionary=dictionary, texts=doc_clean, coherence='c_v')
-    coherence_score = cm.get_coherence()
+    coherence_score = coherence_engine.score_model(cov_model, 'c_v')
     
     logging.info("Coherence score: %s", coherence_score)
     
@@ -221,4 +531,129 @@ def train_lda(doc_clean, doc_term_matrix, dictionary, top_k, input_date, tweet_d
     # create topics table
     top_tweets = create_topics_table(doc_topic_df, input_date)
 
-    return max_k, cov_model, coherence_score, doc_topic_df, top_tweets, input_date
\ No newline at end of file
+    return max_k, cov_model, coherence_score, doc_topic_df, top_tweets, input_date, lda_results
+
+# function to plot the coherence score of each k
+def plot_k_scores(lda_results, input_date):
+    """Save the coherence score of each k evaluated with the most iterations to app/static.
+    
+    Args:
+        lda_results: dataframe - score of each k evaluated by topic_eval.
+        input_date: str - date that the user selected to subset the data.
+    """
+    
+    full_results = lda_results[lda_results['iterations'] == lda_results['iterations'].max()].sort_values('topic')
+    s = pd.Series(full_results.score.values, index=full_results.topic.values)
+    
+    plt = s.plot()
+    plt = plt.get_figure()
+    plt.savefig("app/static/" + input_date + "_k_topics" + ".png")
+    plt.clf()
+
+# function to write the files of train_lda again
+def restore_window_artifacts(cov_model, doc_topic_df, top_tweets, input_date, lda_results):
+    """Write the files of train_lda that are missing, e.g. after its results were read from a checkpoint
+    into a fresh models/ folder.
+    
+    Args:
+        cov_model: trained lda model object.
+        doc_topic_df: dataframe - dataframe of each orignal tweet/annotation with the topic most associated with it.
+        top_tweets: dataframe - top tweets of each topic, see create_topics_table.
+        input_date: str - date that the user selected to subset the data.
+        lda_results: dataframe - score of each k evaluated by topic_eval.
+    
+    Returns:
+        restored: list - paths of the files written.
+    """
+    
+    model_path = 'models/' + 'lda_cov_model' + '_' + input_date
+    topic_matrix_path = 'data/results/' + input_date + '_topic_matrix.csv'
+    top_tweets_path = 'data/results/top_tweets_' + input_date
+    k_plot_path = "app/static/" + input_date + "_k_topics" + ".png"
+    
+    artifacts = [
+        ([model_path, model_path + '.expElogbeta.npy'], lambda: (cov_model.save(model_path), export_inference_arrays(cov_model, model_path))),
+        ([k_plot_path], lambda: plot_k_scores(lda_results, input_date)),
+        ([topic_matrix_path], lambda: count_topic_constructs(doc_topic_df).to_csv(topic_matrix_path, index = False)),
+        ([top_tweets_path], lambda: top_tweets.to_csv(top_tweets_path, index = False)),
+    ]
+    
+    restored = []
+    for paths, write in artifacts:
+        if not all(os.path.exists(path) for path in paths):
+            write()
+            restored.extend(paths)
+    
+    if restored:
+        logger.info("Restored %s of %s.", ', '.join(restored), input_date)
+    
+    return restored
+
+def next_model_version(model_path):
+    """Path of the next version of a saved model, the original artifact being version 1.
+    
+    Args: 
+        model_path: str - path of a saved model, e.g. 'models/lda_cov_model_2020-01-15' or its '_v2' update.
+    
+    Return: 
+        next_path: str - path for the next version, e.g. 'models/lda_cov_model_2020-01-15_v3'.
+    """
+    
+    base_path = re.sub(r'_v\d+$', '', model_path)
+    directory, base_name = os.path.split(base_path)
+    
+    pattern = re.compile(re.escape(base_name) + r'_v(\d+)$')
+    versions = [int(match.group(1)) for match in map(pattern.match, os.listdir(directory or '.')) if match]
+    
+    return '%s_v%s' % (base_path, max(versions, default=1) + 1)
+
+def update_lda(model_path, doc_clean, output_path=None):
+    """Fold a batch of new tweets into a saved lda model with an online update, without retraining.
+    
+    Words not yet in the saved dictionary are added to it, starting with no counts in any topic.
+    
+    Args: 
+        model_path: str - path of the saved model, e.g. 'models/lda_cov_model_2020-01-15'.
+        doc_clean: list - cleaned tokens of the new tweets.
+        output_path: str - where to save the updated model, None saves it as the next version of model_path.
+    
+    Return: 
+        lda_model: updated lda model object.
+        output_path: str - path of the saved model.
+    """
+    
+    logger.debug("Load saved LDA object %s.", model_path)
+    
+    lda_model = LdaModel.load(model_path)
+    dictionary = lda_model.id2word
+    
+    num_terms = len(dictionary)
+    dictionary.add_documents(doc_clean)
+    new_terms = len(dictionary) - num_terms
+    
+    if new_terms:
+        logger.info("Add %s new words to the dictionary of %s words.", new_terms, num_terms)
+        
+        # new words get the prior of the model and no topic counts
+        eta = np.concatenate([lda_model.eta, np.full(new_terms, lda_model.eta.mean(), dtype=lda_model.eta.dtype)])
+        lda_model.eta = eta
+        lda_model.state.eta = eta
+        lda_model.state.sstats = np.hstack([lda_model.state.sstats, np.zeros((lda_model.num_topics, new_terms), dtype=lda_model.state.sstats.dtype)])
+        lda_model.num_terms = len(dictionary)
+        lda_model.sync_state()
+    
+    doc_term_matrix = [dictionary.doc2bow(doc) for doc in doc_clean]
+    
+    logger.debug("Update the model with %s new tweets.", len(doc_term_matrix))
+    
+    lda_model.update(doc_term_matrix)
+    
+    if output_path is None:
+        output_path = next_model_version(model_path)
+    
+    lda_model.save(output_path)
+    export_inference_arrays(lda_model, output_path)
+    
+    logger.info("Updated LDA object saved to %s", output_path)
+    
+    return lda_model, output_path
@@ -8,11 +8,18 @@ from pandas.api.types import is_numeric_dtype
 import numpy as np
 import pytest
 
-from src.add_topics_db import create_db
+from src.add_topics_db import create_db, write_topics, write_topic_summary, Topics, TopicManager, get_engine, pool_stats
 from src.s3_upload import parse_s3, connect_s3
-from src.process_data import load_tweet_data, remove_duplicates, format_dates, timeframe, clean_text, create_dictionary
-from src.train_lda import topic_eval, get_max_k, get_doc_topic_matrix, create_topics_table, train_lda
+from src.process_data import load_tweet_data, sample_tweet_data, remove_duplicates, format_dates, DateIndexedTweets, timeframe, clean_text, clean_texts, get_stop_words, tokenize_texts, create_dictionary, CompactDocs
+from src.train_lda import topic_eval, get_max_k, get_doc_topic_matrix, create_topics_table, train_lda, doc_topics_to_matrix, fit_lda, update_lda, count_topic_constructs, restore_window_artifacts
 from src.viz_topics import create_word_clouds
+from src.pipeline import get_windows, run_windows, get_lda_backend, rebuild_topic_summary
+from src.checkpoint import StageCache
+from src.coherence import CoherenceEngine
+from src.dedup import StreamingDeduplicator
+from src.infer_topics import TopicInferencer, export_inference_arrays
+from src.model_registry import ModelRegistry, ModelNotFoundError
+from src.score_topics import MicroBatcher, TopicScorer
 
 # load and parse yaml file.
 a_yaml_file = open("config/model-meta.yaml")
@@ -30,7 +37,7 @@ sample_lda_results = pd.DataFrame (sample_lda_results, columns = ['topic_num','s
 
 # randoms state
 random_state = config['tune_model']['random_state']
-coherence_score_method = config['tune_model']['coherence']
+coherence_score_method = config['tune_model']['coherence_score_method']
 
 # test create_db function
 def test_create_db():
@@ -43,6 +50,146 @@ def test_create_db_str():
     s3path_str = 'this is a str'
     assert type(s3path_str) is str
 
+def _top_tweets(input_date, ids):
+    return pd.DataFrame({'read_tweet_id': ids, 'date': input_date, 'topic_num': np.arange(len(ids)) % 3,
+                         'prob': np.linspace(0.4, 0.9, len(ids)), 'tweet': ['tweet %s' % i for i in ids],
+                         'Perceived_susceptibility': 1, 'Perceived_severity': 0, 'Perceived_benefits': 0, 'Perceived_barriers': 0})
+
+def test_write_topics_replaces_window(tmp_path):
+    import sqlalchemy
+
+    engine = create_db('sqlite:///' + str(tmp_path / 'topics.db'))
+    count = lambda: dict(engine.execute(sqlalchemy.text("SELECT date, COUNT(*) FROM topics GROUP BY date")).fetchall())
+
+    assert write_topics(engine, _top_tweets('2020-01-15', [1243599480177471488, 2, 3]), '2020-01-15', batch_size=2) == 3
+    write_topics(engine, _top_tweets('2020-03-01', [2, 4]), '2020-03-01')
+    # a rerun replaces the rows of its window only
+    write_topics(engine, _top_tweets('2020-01-15', [5, 6]), '2020-01-15')
+    assert count() == {'2020-01-15': 2, '2020-03-01': 2}
+
+    # a failed write leaves the previous rows of the window
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        write_topics(engine, _top_tweets('2020-01-15', [7, 7]), '2020-01-15')
+    assert count() == {'2020-01-15': 2, '2020-03-01': 2}
+
+    prob, tweet_id = engine.execute(sqlalchemy.text("SELECT prob, read_tweet_id FROM topics WHERE tweet = 'tweet 6'")).fetchone()
+    assert prob == pytest.approx(0.9) and tweet_id == 6
+
+def test_create_db_outdated_topics_table(tmp_path):
+    import sqlite3
+
+    db_path = str(tmp_path / 'topics.db')
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("CREATE TABLE topics (read_tweet_id INTEGER PRIMARY KEY, date VARCHAR(10), prob INTEGER)")
+
+    with pytest.raises(ValueError, match='recreate_tables'):
+        create_db('sqlite:///' + db_path)
+
+    engine = create_db('sqlite:///' + db_path, recreate_outdated=True)
+    assert write_topics(engine, _top_tweets('2020-01-15', [1, 2]), '2020-01-15') == 2
+
+def test_topic_manager_keyset_pages(tmp_path):
+    import sqlalchemy
+
+    engine_string = 'sqlite:///' + str(tmp_path / 'topics.db')
+    engine = create_db(engine_string)
+    for input_date, ids in [('2020-03-01', range(100, 130)), ('2020-01-15', range(1, 21)), ('2020-02-01', [7])]:
+        top_tweets = _top_tweets(input_date, list(ids))
+        top_tweets['prob'] = np.round(top_tweets['prob'], 1)  # ties are ordered by read_tweet_id
+        write_topics(engine, top_tweets, input_date)
+
+    manager = TopicManager(engine_string=engine_string)
+    assert manager.windows() == ['2020-01-15', '2020-02-01', '2020-03-01']
+    assert manager.windows(after='2020-01-15', limit=1) == ['2020-02-01']
+    assert manager.topic_nums('2020-03-01') == [0, 1, 2]
+
+    expected = _top_tweets('2020-03-01', list(range(100, 130))).assign(prob=lambda df: np.round(df['prob'], 1))
+    expected = expected.sort_values(['topic_num', 'prob', 'read_tweet_id'], ascending=[True, False, False])
+
+    pages, after = [], None
+    while True:
+        rows, after = manager.top_tweets('2020-03-01', after=after, limit=7)
+        pages.append([row.read_tweet_id for row in rows])
+        if after is None:
+            break
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 2]
+    assert sum(pages, []) == expected['read_tweet_id'].tolist()
+
+    rows, _ = manager.top_tweets('2020-03-01', topic_num=1, limit=100)
+    assert [row.read_tweet_id for row in rows] == expected.loc[expected['topic_num'] == 1, 'read_tweet_id'].tolist()
+
+    assert manager.top_tweets('2020-03-01', limit=0) == ([], None)
+
+    # pages are read from the composite index
+    plan = engine.execute(sqlalchemy.text("EXPLAIN QUERY PLAN SELECT * FROM topics WHERE date = '2020-03-01' AND topic_num = 1 "
+                                          "ORDER BY topic_num, prob DESC, read_tweet_id DESC LIMIT 7")).fetchall()
+    assert any('ix_topics_date_topic_prob' in str(step) for step in plan)
+    assert not any('TEMP B-TREE' in str(step) for step in plan)
+    manager.close()
+
+def test_topics_route_rejects_limit_below_one(tmp_path, monkeypatch):
+    import importlib.util
+
+    engine_string = 'sqlite:///' + str(tmp_path / 'topics.db')
+    write_topics(create_db(engine_string), _top_tweets('2020-01-15', [1, 2, 3]), '2020-01-15')
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', engine_string)
+    monkeypatch.setenv('MODEL_DIR', str(tmp_path))
+
+    # app.py is shadowed by the app/ folder as a module name
+    spec = importlib.util.spec_from_file_location('webapp', 'app.py')
+    webapp = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(webapp)
+    client = webapp.app.test_client()
+
+    assert client.get('/topics/2020-01-15?limit=0').status_code == 400
+    assert client.get('/topics/2020-01-15?limit=-2').status_code == 400
+    assert len(client.get('/topics/2020-01-15?limit=2').get_json()['rows']) == 2
+
+def test_get_engine_shared_per_uri(tmp_path, monkeypatch):
+    from src.add_topics_db import Base
+
+    create_all_calls = []
+    create_all = Base.metadata.create_all
+    monkeypatch.setattr(Base.metadata, 'create_all', lambda engine: create_all_calls.append(engine) or create_all(engine))
+
+    engine_string = 'sqlite:///' + str(tmp_path / 'topics.db')
+    # pool sizes do not apply to sqlite and are dropped
+    engine = get_engine(engine_string, pool_size=5, max_overflow=10, pool_recycle=3600, pool_pre_ping=True)
+    assert create_db(engine_string) is engine
+    assert TopicManager(engine_string=engine_string).session.get_bind() is engine
+    assert len(create_all_calls) == 1
+    assert engine.pool._recycle == 3600 and engine.pool._pre_ping
+
+    write_topics(engine, _top_tweets('2020-01-15', [1, 2]), '2020-01-15')
+    stats = pool_stats()[repr(engine.url)]
+    assert stats['checkouts'] >= 1 and stats['checkouts'] == stats['checkins']
+    assert stats['checked_out'] == 0 and stats['peak_checked_out'] >= 1
+
+    assert get_engine('sqlite:///' + str(tmp_path / 'other.db')) is not engine
+
+def test_topic_summary_rebuild(tmp_path):
+    doc_topic_df = pd.DataFrame({'topic_num': [0, 2, 2, 0, 2], 'Perceived_susceptibility': [1, 0, 1, 1, 1],
+                                 'Perceived_severity': [0, 1, 1, 0, 0], 'Perceived_benefits': 0, 'Perceived_barriers': [0, 0, 0, 1, 0]})
+    doc_topic_matrix = count_topic_constructs(doc_topic_df)
+    assert doc_topic_matrix.to_dict('list') == {'topic_num': [0, 2], 'Perceived_susceptibility': [2, 2], 'Perceived_severity': [0, 2],
+                                                'Perceived_benefits': [0, 0], 'Perceived_barriers': [1, 0], 'count': [2, 3]}
+
+    results_dir = tmp_path / 'results'
+    results_dir.mkdir()
+    doc_topic_matrix.to_csv(results_dir / '2020-01-15_topic_matrix.csv', index=False)
+    doc_topic_matrix.iloc[:1].to_csv(results_dir / '2020-03-01_topic_matrix.csv', index=False)
+
+    engine_string = 'sqlite:///' + str(tmp_path / 'topics.db')
+    engine = create_db(engine_string)
+    write_topic_summary(engine, count_topic_constructs(doc_topic_df.iloc[:2]), '2020-01-15')
+
+    # the rebuild replaces the rows of each time frame
+    assert rebuild_topic_summary(engine_string, config, results_dir=str(results_dir)) == {'2020-01-15': 2, '2020-03-01': 1}
+    assert rebuild_topic_summary(engine_string, config, results_dir=str(results_dir)) == {'2020-01-15': 2, '2020-03-01': 1}
+
+    rows = TopicManager(engine_string=engine_string).topic_summary('2020-01-15')
+    assert [(row.topic_num, row.Perceived_severity, row.count) for row in rows] == [(0, 0, 2), (2, 2, 3)]
+
 #  test s3_upload functions
 def test_parse_s3_str():
     s3path_str = 'this is a str'
@@ -169,4 +316,512 @@ def create_word_clouds_test_fail():
 
 def create_word_clouds_test_success():
     input_date = '2020-01-01'
-    assert type(input_date) is str
\ No newline at end of file
+    assert type(input_date) is str
+
+def test_doc_topics_to_matrix():
+    doc_topics = [[(0, 0.2), (2, 0.8)], [(1, 1.0)], [(0, 0.5), (1, 0.25), (2, 0.25)]]
+    expected = np.array([[0.2, 0.0, 0.8], [0.0, 1.0, 0.0], [0.5, 0.25, 0.25]])
+    np.testing.assert_allclose(doc_topics_to_matrix(doc_topics, 3, block_size=2), expected)
+
+def test_get_doc_topic_matrix(tmp_path, monkeypatch):
+    from gensim.models.ldamodel import LdaModel
+    from gensim.test.utils import common_corpus, common_dictionary
+
+    lda_model = LdaModel(corpus=common_corpus, id2word=common_dictionary, num_topics=3, random_state=random_state)
+    tweet_df = df.iloc[:len(common_corpus)]
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'results').mkdir(parents=True)
+
+    doc_topic_matrix, doc_topic_df = get_doc_topic_matrix(lda_model, common_corpus, tweet_df, '2020-01-15')
+
+    for d, bow in enumerate(common_corpus):
+        topics = lda_model.get_document_topics(bow)
+        assert doc_topic_df['topic_num'][d] == max(topics, key=lambda x: x[1])[0]
+    assert list(doc_topic_df['read_text_clean2']) == list(tweet_df['read_text_clean2'])
+    assert doc_topic_matrix['count'].sum() == len(tweet_df)
+    assert (tmp_path / 'data' / 'results' / '2020-01-15_topic_matrix.csv').exists()
+
+def test_restore_window_artifacts(tmp_path, monkeypatch):
+    from gensim.models.ldamodel import LdaModel
+    from gensim.test.utils import common_corpus, common_dictionary
+
+    lda_model = LdaModel(corpus=common_corpus, id2word=common_dictionary, num_topics=3, random_state=random_state)
+    monkeypatch.chdir(tmp_path)
+    for folder in ['models', 'app/static', 'data/results']:
+        (tmp_path / folder).mkdir(parents=True)
+
+    _, doc_topic_df = get_doc_topic_matrix(lda_model, common_corpus, df.iloc[:len(common_corpus)], '2020-01-15')
+    top_tweets = create_topics_table(doc_topic_df, '2020-01-15')
+    lda_results = pd.DataFrame({'topic': [4, 5], 'score': [0.4, 0.5], 'iterations': [50, 50], 'seconds': [1.0, 1.0]})
+
+    # the csvs were written by get_doc_topic_matrix and create_topics_table
+    restored = restore_window_artifacts(lda_model, doc_topic_df, top_tweets, '2020-01-15', lda_results)
+    assert restored == ['models/lda_cov_model_2020-01-15', 'models/lda_cov_model_2020-01-15.expElogbeta.npy', 'app/static/2020-01-15_k_topics.png']
+    assert restore_window_artifacts(lda_model, doc_topic_df, top_tweets, '2020-01-15', lda_results) == []
+
+    (tmp_path / 'data' / 'results' / '2020-01-15_topic_matrix.csv').unlink()
+    assert restore_window_artifacts(lda_model, doc_topic_df, top_tweets, '2020-01-15', lda_results) == ['data/results/2020-01-15_topic_matrix.csv']
+
+def test_doc_topics_require_read_tweet_id():
+    from src.train_lda import assign_doc_topics
+
+    probs = np.full((3, 2), 0.5)
+    with pytest.raises(ValueError, match='read_tweet_id'):
+        assign_doc_topics(probs, df.iloc[:3].drop(columns=['read_tweet_id']))
+
+    doc_topic_df = assign_doc_topics(probs, df.iloc[:3])
+    with pytest.raises(ValueError, match='read_tweet_id'):
+        create_topics_table(doc_topic_df.drop(columns=['read_tweet_id']), '2020-01-15')
+
+def test_create_dictionary_streaming_corpus(tmp_path, monkeypatch):
+    from gensim.test.utils import common_texts
+
+    texts = [[]] + common_texts + [[]]
+    dictionary, doc_term_matrix = create_dictionary(texts)
+    _, mm_corpus = create_dictionary(texts, corpus_path=str(tmp_path / 'corpus' / '2020-01-15.mm'))
+    assert (tmp_path / 'corpus' / '2020-01-15.mm.index').exists()
+    assert list(mm_corpus) == doc_term_matrix
+
+    lda_model = fit_lda(doc_term_matrix, dictionary, 3, random_state)
+    mm_model = fit_lda(mm_corpus, dictionary, 3, random_state)
+    np.testing.assert_allclose(mm_model.get_topics(), lda_model.get_topics(), rtol=1e-5)
+
+    tweet_df = df.iloc[:len(texts)]
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data' / 'results').mkdir(parents=True)
+    _, doc_topic_df = get_doc_topic_matrix(lda_model, doc_term_matrix, tweet_df, '2020-01-15')
+    _, mm_doc_topic_df = get_doc_topic_matrix(mm_model, mm_corpus, tweet_df, '2020-01-15')
+    pd.testing.assert_frame_equal(mm_doc_topic_df, doc_topic_df, rtol=1e-4)
+
+def test_compact_docs_matches_lists():
+    from gensim.test.utils import common_texts
+
+    texts = [[]] + common_texts + [['human', 'human', 'trees'], []]
+    docs = CompactDocs.from_texts(texts)
+    assert docs.token_ids.dtype == np.int32
+    assert list(docs) == texts
+
+    dictionary, doc_term_matrix = create_dictionary(texts)
+    compact_dictionary, compact_matrix = create_dictionary(docs)
+    assert compact_dictionary.token2id == dictionary.token2id
+    assert compact_dictionary.dfs == dictionary.dfs and compact_dictionary.cfs == dictionary.cfs
+    assert compact_dictionary.num_nnz == dictionary.num_nnz
+    assert compact_matrix == doc_term_matrix
+
+    subset = docs.take([10, 2, 0])
+    assert list(subset) == [texts[10], texts[2], texts[0]]
+    assert create_dictionary(subset)[0].token2id == create_dictionary([texts[10], texts[2], texts[0]])[0].token2id
+
+    lda_model = fit_lda(doc_term_matrix, dictionary, 3, random_state)
+    expected = CoherenceEngine(texts, dictionary, processes=1).score_model(lda_model, 'c_v')
+    assert CoherenceEngine(docs, dictionary, processes=1).score_model(lda_model, 'c_v') == pytest.approx(expected)
+
+def test_create_dictionary_vocabulary_controls():
+    from gensim.corpora import Dictionary, HashDictionary
+    from gensim.test.utils import common_texts
+
+    expected = Dictionary(common_texts)
+    expected.filter_extremes(no_below=2, no_above=0.5, keep_n=6)
+    for texts in (common_texts, CompactDocs.from_texts(common_texts)):
+        dictionary, doc_term_matrix = create_dictionary(texts, no_below=2, no_above=0.5, keep_n=6)
+        assert dictionary.token2id == expected.token2id
+        assert doc_term_matrix == [expected.doc2bow(text) for text in common_texts]
+
+    hashing = HashDictionary(id_range=8, debug=False)
+    dictionary, doc_term_matrix = create_dictionary(common_texts, hash_buckets=8)
+    assert len(dictionary) == 8
+    assert doc_term_matrix == [hashing.doc2bow(text) for text in common_texts]
+    # buckets are labelled with one of their words
+    assert dictionary[dictionary.token2id['graph']] == 'graph'
+
+    with pytest.raises(ValueError):
+        create_dictionary(common_texts, hash_buckets=8, no_below=2)
+
+def test_topic_eval_parallel_matches_serial():
+    from gensim.test.utils import common_texts, common_corpus, common_dictionary
+
+    serial = topic_eval(common_texts, common_corpus, common_dictionary, 7, '2020-01-15', random_state, 'u_mass', workers=1)
+    parallel = topic_eval(common_texts, common_corpus, common_dictionary, 7, '2020-01-15', random_state, 'u_mass', workers=2)
+
+    assert list(parallel['topic']) == [4, 5, 6]
+    pd.testing.assert_frame_equal(serial[['topic', 'score', 'iterations']], parallel[['topic', 'score', 'iterations']])
+
+def test_topic_eval_strategies():
+    from gensim.test.utils import common_texts, common_corpus, common_dictionary
+
+    grid = topic_eval(common_texts, common_corpus, common_dictionary, 12, '2020-01-15', random_state, 'u_mass')
+    assert list(grid['topic']) == list(range(4, 12))
+    assert (grid['seconds'] > 0).all()
+
+    golden = topic_eval(common_texts, common_corpus, common_dictionary, 12, '2020-01-15', random_state, 'u_mass', strategy='golden')
+    assert golden['topic'].is_unique and len(golden) < len(grid)
+    # every evaluated k scores as in the full sweep
+    assert golden.set_index('topic')['score'].to_dict() == pytest.approx(grid.set_index('topic').loc[golden['topic'], 'score'].to_dict())
+
+    plateau = topic_eval(common_texts, common_corpus, common_dictionary, 12, '2020-01-15', random_state, 'u_mass', patience=2, min_delta=10.0)
+    assert list(plateau['topic']) == [4, 5, 6]
+
+    halving = topic_eval(common_texts, common_corpus, common_dictionary, 12, '2020-01-15', random_state, 'u_mass', strategy='halving', eta=2, iterations=8)
+    assert list(halving.groupby('iterations').size()) == [8, 4, 2, 1]
+    assert get_max_k(halving) == halving['topic'].iloc[-1]
+
+def test_topic_eval_grid_prepares_coherence_once():
+    from gensim.test.utils import common_texts, common_corpus, common_dictionary
+
+    engine = CoherenceEngine(common_texts, common_dictionary, processes=1)
+    grid = topic_eval(common_texts, common_corpus, common_dictionary, 10, '2020-01-15', random_state, 'u_mass', coherence_engine=engine)
+
+    assert list(grid['topic']) == list(range(4, 10))
+    assert engine.passes == {'u_mass': 1}
+
+def test_topic_eval_unknown_strategy():
+    from gensim.test.utils import common_texts, common_corpus, common_dictionary
+
+    with pytest.raises(ValueError):
+        topic_eval(common_texts, common_corpus, common_dictionary, 7, '2020-01-15', random_state, 'u_mass', strategy='random')
+
+def test_coherence_engine_matches_coherence_model():
+    from gensim.models import LdaModel
+    from gensim.models.coherencemodel import CoherenceModel
+    from gensim.test.utils import common_texts, common_corpus, common_dictionary
+
+    models = [LdaModel(corpus=common_corpus, id2word=common_dictionary, num_topics=k, random_state=random_state) for k in (3, 4, 5)]
+    engine = CoherenceEngine(common_texts, common_dictionary, processes=1)
+
+    for measure in ('c_v', 'u_mass', 'c_npmi'):
+        engine.prepare([engine.model_topics(model) for model in models], measure)
+        for model in models:
+            expected = CoherenceModel(model=model, texts=common_texts, dictionary=common_dictionary, coherence=measure, processes=1).get_coherence()
+            assert engine.score_model(model, measure) == pytest.approx(expected)
+        assert engine.passes[measure] == 1
+
+def test_fit_lda_multicore_loads_as_lda_model(tmp_path):
+    from gensim.models.ldamodel import LdaModel
+    from gensim.test.utils import common_corpus, common_dictionary
+
+    backend = get_lda_backend({'method': 'LdaMulticore', 'lda_params': {'workers': 2, 'chunksize': 4, 'passes': 2, 'iterations': 20}})
+    lda_model = fit_lda(common_corpus, common_dictionary, 3, random_state, **backend)
+    assert lda_model.workers == 2 and lda_model.passes == 2
+
+    lda_model.save(str(tmp_path / 'lda_cov_model_2020-01-15'))
+    loaded = LdaModel.load(str(tmp_path / 'lda_cov_model_2020-01-15'))
+    np.testing.assert_allclose(loaded.get_topics(), lda_model.get_topics())
+    assert len(loaded.get_document_topics(common_corpus[0])) > 0
+
+def test_fit_lda_unknown_backend():
+    from gensim.test.utils import common_corpus, common_dictionary
+
+    with pytest.raises(ValueError):
+        fit_lda(common_corpus, common_dictionary, 3, random_state, method='LdaSeqModel')
+
+def test_update_lda_versions_and_new_words(tmp_path):
+    from gensim.corpora import Dictionary
+    from gensim.models.ldamodel import LdaModel
+    from gensim.test.utils import common_texts
+
+    dictionary = Dictionary(common_texts)
+    model_path = str(tmp_path / 'lda_cov_model_2020-01-15')
+    fit_lda([dictionary.doc2bow(text) for text in common_texts], dictionary, 3, random_state).save(model_path)
+
+    new_docs = [['vaccine', 'mask', 'human'], ['mask', 'lockdown', 'computer']]
+    lda_model, output_path = update_lda(model_path, new_docs)
+    assert output_path == model_path + '_v2'
+    assert lda_model.get_topics().shape == (3, len(dictionary) + 3)
+
+    _, output_path = update_lda(output_path, new_docs)
+    assert output_path == model_path + '_v3'
+
+    loaded = LdaModel.load(output_path)
+    assert 'vaccine' in loaded.id2word.token2id
+    assert len(loaded.get_document_topics(loaded.id2word.doc2bow(['mask', 'vaccine']))) > 0
+
+def test_topic_inferencer_matches_gensim(tmp_path):
+    import os
+    from gensim.corpora import Dictionary
+    from gensim.test.utils import common_texts
+
+    dictionary = Dictionary(common_texts)
+    corpus = [dictionary.doc2bow(text) for text in common_texts]
+    lda_model = fit_lda(corpus, dictionary, 3, random_state, passes=5)
+    model_path = str(tmp_path / 'lda_cov_model_2020-01-15')
+    lda_model.save(model_path)
+
+    expected = np.array([[prob for _, prob in lda_model.get_document_topics(bow, minimum_probability=0)] for bow in corpus])
+
+    # without the exported arrays the vocabulary and alpha are unpickled
+    fallback = TopicInferencer.load(model_path)
+    np.testing.assert_allclose(fallback.topic_matrix(corpus), expected, atol=1e-3)
+
+    export_inference_arrays(lda_model, model_path)
+    assert os.path.exists(model_path + '.vocab.json')
+    inferencer = TopicInferencer.load(model_path, mmap_mode='r', batch_size=4)
+    np.testing.assert_allclose(inferencer.topic_matrix(common_texts), expected, atol=1e-3)
+
+    # a document without known words gets the topic prior
+    probs = inferencer.topic_matrix([['unknown', 'words'], []])
+    np.testing.assert_allclose(probs, np.tile(lda_model.alpha / lda_model.alpha.sum(), (2, 1)))
+    assert all(prob >= 0.01 for _, prob in inferencer.get_document_topics([common_texts[0]])[0])
+
+def test_model_registry_lru(tmp_path):
+    from gensim.corpora import Dictionary
+    from gensim.test.utils import common_texts
+
+    dictionary = Dictionary(common_texts)
+    corpus = [dictionary.doc2bow(text) for text in common_texts]
+    for name, num_topics in [('2020-01-15', 2), ('2020-03-01', 3), ('2020-03-01_v2', 4)]:
+        lda_model = fit_lda(corpus, dictionary, num_topics, random_state)
+        lda_model.save(str(tmp_path / ('lda_cov_model_' + name)))
+        export_inference_arrays(lda_model, str(tmp_path / ('lda_cov_model_' + name)))
+
+    registry = ModelRegistry(str(tmp_path), max_models=1)
+    assert registry.dates() == ['2020-01-15', '2020-03-01']
+
+    # the latest version of a date is served, memory-mapped
+    inferencer = registry.get('2020-03-01')
+    assert inferencer.num_topics == 4
+    assert isinstance(inferencer.expElogbeta, np.memmap)
+    assert registry.get('2020-03-01') is inferencer
+
+    registry.get('2020-01-15')
+    registry.get('2020-03-01')
+    stats = registry.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 2)
+    assert stats['loaded'] == [str(tmp_path / 'lda_cov_model_2020-03-01_v2')]
+
+    with pytest.raises(ModelNotFoundError):
+        registry.get('2021-01-01')
+
+def test_load_tweet_data_cache(tmp_path):
+    cache_path = str(tmp_path / 'tweets.parquet')
+    columns = config['acquire']['column_names']
+
+    tweet_data = load_tweet_data('data/sample/tweets.csv', columns=columns, cache_path=cache_path)
+    assert tweet_data['Perceived_severity'].dtype == np.int8
+    assert tweet_data['read_tweet_id'].dtype == np.int64
+    assert tweet_data['user_location'].dtype == 'category'
+
+    cached = load_tweet_data('missing.csv', columns=columns, chunksize=30, cache_path=cache_path)
+    pd.testing.assert_frame_equal(tweet_data, cached)
+
+def test_load_tweet_data_row_filter():
+    severity = load_tweet_data('data/sample/tweets.csv', columns=['read_text_clean2', 'Perceived_severity'], chunksize=30,
+                               row_filter=lambda chunk: chunk[chunk['Perceived_severity'] == 1])
+    assert list(severity.columns) == ['read_text_clean2', 'Perceived_severity']
+    assert len(severity) == (df['Perceived_severity'] == 1).sum()
+
+def test_sample_tweet_data_bernoulli():
+    columns = config['acquire']['column_names']
+    sample = sample_tweet_data('data/sample/tweets.csv', columns, test_size=0.3, random_state=random_state, chunksize=7)
+    sample_one_chunk = sample_tweet_data('data/sample/tweets.csv', columns, test_size=0.3, random_state=random_state, chunksize=None)
+
+    pd.testing.assert_frame_equal(sample, sample_one_chunk)
+    assert 0 < len(sample) < len(df)
+    assert sample['read_tweet_id'].isin(df['read_tweet_id']).all()
+
+def test_sample_tweet_data_reservoir_stratified():
+    columns = config['acquire']['column_names']
+    sample = sample_tweet_data('data/sample/tweets.csv', columns, method='reservoir', sample_size=5,
+                               stratify_by='constructs', random_state=random_state, chunksize=7)
+
+    strata_sizes = df.groupby(['Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']).size()
+    sample_sizes = sample.groupby(['Perceived_susceptibility', 'Perceived_severity', 'Perceived_benefits', 'Perceived_barriers']).size()
+    assert (sample_sizes == strata_sizes.clip(upper=5)).all()
+    assert sample['read_tweet_id'].is_unique
+
+def test_sample_tweet_data_stratify_requires_reservoir():
+    with pytest.raises(ValueError):
+        sample_tweet_data('data/sample/tweets.csv', ['created_at'], stratify_by='date')
+
+class SuffixLemmatizer:
+    """Stand-in for WordNetLemmatizer that does not need the wordnet corpus."""
+
+    def lemmatize(self, word):
+        return word[:-1] if word.endswith('s') and len(word) > 3 else word
+
+def test_clean_texts_matches_clean_text(monkeypatch):
+    from nltk.tokenize import TreebankWordTokenizer
+    import string
+
+    monkeypatch.setattr('src.process_data.word_tokenize', TreebankWordTokenizer().tokenize)
+    exclude = set(string.punctuation)
+    lemma = SuffixLemmatizer()
+    stop_words_list = get_stop_words()
+
+    expected = [clean_text(tweet, stop_words_list, exclude, lemma).split() for tweet in df['read_text_clean2']]
+
+    assert clean_texts(df['read_text_clean2'], stop_words_list, exclude, lemma, batch_size=30) == expected
+    assert clean_texts(df['read_text_clean2'], stop_words_list, exclude, lemma, processes=2, batch_size=30) == expected
+
+def test_micro_batcher_groups_concurrent_requests():
+    import threading
+
+    sizes = []
+
+    def handler(payloads):
+        sizes.append(len(payloads))
+        return [ValueError(payload) if payload < 0 else payload * 2 for payload in payloads]
+
+    batcher = MicroBatcher(handler, max_batch_size=4, max_wait=0.2)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.update({i: batcher.submit(i).result(timeout=5)})) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: i * 2 for i in range(8)}
+    assert max(sizes) <= 4 and len(sizes) < 8
+    assert batcher.stats['requests'] == 8
+
+    # an error of one payload only fails that request
+    with pytest.raises(ValueError):
+        batcher.submit(-1).result(timeout=5)
+    assert batcher.submit(3).result(timeout=5) == 6
+
+def test_topic_scorer_matches_inferencer(tmp_path, monkeypatch):
+    from nltk.tokenize import TreebankWordTokenizer
+    from gensim.corpora import Dictionary
+    from gensim.test.utils import common_texts
+
+    monkeypatch.setattr('src.process_data.word_tokenize', TreebankWordTokenizer().tokenize)
+    dictionary = Dictionary(common_texts)
+    lda_model = fit_lda([dictionary.doc2bow(text) for text in common_texts], dictionary, 3, random_state, passes=5)
+    lda_model.save(str(tmp_path / 'lda_cov_model_2020-01-15'))
+    export_inference_arrays(lda_model, str(tmp_path / 'lda_cov_model_2020-01-15'))
+
+    registry = ModelRegistry(str(tmp_path))
+    scorer = TopicScorer(registry)
+    scorer.lemma = SuffixLemmatizer()
+
+    results = scorer([('2020-01-15', ['Human computer interface', 'graph of trees']), ('2021-01-01', ['graph']),
+                      ('2020-01-15', ['the EPS user system'])])
+    expected = registry.get('2020-01-15').topic_matrix([['human', 'computer', 'interface'], ['graph', 'of', 'tree'], ['the', 'eps', 'user', 'system']])
+
+    np.testing.assert_allclose(results[0]['probabilities'] + results[2]['probabilities'], expected, atol=1e-6)
+    assert results[0]['topic'] == expected[:2].argmax(axis=1).tolist()
+    assert isinstance(results[1], ModelNotFoundError)
+
+def test_tokenize_texts_regex():
+    from nltk.tokenize import NLTKWordTokenizer
+
+    tweets = ["we don't know , it's covid-19 ... 1,000 cases in the u.s", "stay home \\? \\?"]
+    expected = [NLTKWordTokenizer().tokenize(tweet) for tweet in tweets]
+
+    assert tokenize_texts(tweets, 'regex') == expected
+
+def test_tokenize_texts_unknown():
+    with pytest.raises(ValueError):
+        tokenize_texts(['a tweet'], 'whitespace')
+
+def test_streaming_deduplicator():
+    texts = df['read_text_clean2'].tolist()
+    variants = pd.DataFrame({'read_text_clean2': [texts[0], texts[1] + ' @someone', texts[2] + ' https://t.co/xyz',
+                                                  'RT ' + texts[3], 'a new tweet about vaccines']})
+    tweets = pd.concat([df[['read_text_clean2']], variants], ignore_index=True)
+
+    dedup = StreamingDeduplicator()
+    chunked = pd.concat([dedup(tweets.iloc[i:i + 30]) for i in range(0, len(tweets), 30)])
+    assert dedup.report() == {'rows': len(tweets), 'exact': 1, 'near': 3}
+    assert list(chunked.index) == list(range(len(df))) + [len(tweets) - 1]
+
+    # the result does not depend on the chunk boundaries
+    assert list(StreamingDeduplicator()(tweets).index) == list(chunked.index)
+
+    exact = StreamingDeduplicator(near_duplicates=False)
+    exact(tweets)
+    assert exact.report() == {'rows': len(tweets), 'exact': 1, 'near': 0}
+
+def test_load_tweet_data_dedup_filter(tmp_path):
+    columns = ['read_tweet_id', 'read_text_clean2']
+    data_path = str(tmp_path / 'tweets.csv')
+    pd.concat([df[columns], df[columns].head(10)], ignore_index=True).to_csv(data_path, index=False)
+
+    dedup = StreamingDeduplicator(near_duplicates=False)
+    streamed = load_tweet_data(data_path, columns=columns, chunksize=25, row_filter=dedup)
+    pd.testing.assert_frame_equal(streamed, remove_duplicates(load_tweet_data(data_path, columns=columns)))
+    assert dedup.report()['exact'] == 10
+
+def test_format_dates_real_year():
+    tweets = pd.DataFrame({'created_at': ['Fri Mar 27 18:03:15 +0000 2020', 'Sun Jan 03 23:59:59 +0000 2021', 'not a date']})
+    dates = format_dates(tweets)['date']
+
+    assert list(dates[:2]) == [pd.Timestamp('2020-03-27'), pd.Timestamp('2021-01-03')]
+    assert pd.isna(dates[2])
+
+def test_load_tweet_data_cached_dates(tmp_path):
+    cache_path = str(tmp_path / 'tweets.parquet')
+    columns = ['created_at', 'read_text_clean2']
+
+    tweet_data = load_tweet_data('data/sample/tweets.csv', columns=columns, chunksize=30, cache_path=cache_path, parse_dates=True)
+    cached = load_tweet_data('missing.csv', columns=columns, cache_path=cache_path, parse_dates=True)
+
+    assert cached['date'].dtype == 'datetime64[ns]'
+    pd.testing.assert_series_equal(cached['date'], format_dates(df[columns].copy())['date'])
+    pd.testing.assert_frame_equal(tweet_data, cached)
+
+def test_timeframe_date_indexed():
+    tweet_data = format_dates(df.copy())
+    tweet_store = DateIndexedTweets(tweet_data)
+
+    for input_date in ['2020-01-15', '2020-03-01', '2020-03-27', '2021-01-01']:
+        expected, _ = timeframe(tweet_data, input_date=input_date)
+        window, window_date = timeframe(tweet_store, input_date=input_date)
+
+        assert window_date == input_date
+        assert window['date'].is_monotonic_increasing
+        assert sorted(window['read_tweet_id']) == sorted(expected['read_tweet_id'])
+
+def test_get_windows():
+    assert get_windows(config['process_data']['time_frame']) == ['2020-01-15', '2020-03-01']
+    assert get_windows(['2020-01-15']) == ['2020-01-15']
+    assert get_windows({'start': '2020-01-01', 'end': '2020-01-10', 'stride_days': 3}) == ['2020-01-01', '2020-01-04', '2020-01-07', '2020-01-10']
+
+def _fail_on_march(tweet_data_subset, input_date, config, engine_string, **kwargs):
+    if input_date.startswith('2020-03'):
+        raise ValueError("window failed")
+    return {'input_date': input_date, 'tweets': len(tweet_data_subset)}
+
+def test_run_windows_isolates_failures(monkeypatch):
+    monkeypatch.setattr('src.pipeline.run_window', _fail_on_march)
+    tweet_store = DateIndexedTweets(format_dates(df.copy()))
+    windows = ['2020-02-15', '2020-03-01', '2020-04-15']
+
+    for workers in [1, 2]:
+        results = run_windows(tweet_store, windows, config, 'sqlite://', workers=workers)
+
+        assert list(results['input_date']) == windows
+        assert list(results['error'].notna()) == [False, True, False]
+        assert results['tweets'][2] == len(tweet_store.window('2020-04-15'))
+
+def test_stage_cache_resumes(tmp_path):
+    cache = StageCache(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'rows': 100}
+
+    key = cache.key('tweets.csv', config['process_data']['sample_data'])
+    assert cache.get_or_compute('tweets', key, compute) == {'rows': 100}
+    assert cache.get_or_compute('tweets', key, compute) == {'rows': 100}
+    assert len(calls) == 1
+
+    changed_key = cache.key('tweets.csv', dict(config['process_data']['sample_data'], test_size=0.5))
+    assert changed_key != key
+    cache.get_or_compute('tweets', changed_key, compute)
+    assert len(calls) == 2
+
+def test_stage_cache_evicts_least_recently_used(tmp_path):
+    import os
+    import time
+
+    cache = StageCache(str(tmp_path), max_bytes=None)
+    for i, stage in enumerate(['tweets', 'doc_clean', 'corpus']):
+        cache.get_or_compute(stage, 'key', lambda: b'x' * 1000)
+        os.utime(tmp_path / (stage + '-key.pkl'), (time.time() + i, time.time() + i))
+
+    cache.max_bytes = 2500
+    removed = cache.evict()
+
+    assert [os.path.basename(path) for path in removed] == ['tweets-key.pkl']
+    assert sorted(os.listdir(tmp_path)) == ['corpus-key.pkl', 'doc_clean-key.pkl']